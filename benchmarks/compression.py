@@ -0,0 +1,90 @@
+"""
+Wire-size / CPU trade-off of response compression on realistic order payloads.
+
+Builds /order- and /history-shaped JSON (orders with repeated keys and
+``fooditems`` arrays) and reports, for each coding and level, the compressed
+size, ratio and compression time per response:
+
+    python -m benchmarks.compression --orders 50 200 1000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import zlib
+
+from utils.compression import BROTLI_AVAILABLE, _load_brotli
+
+DISHES = [
+    ("Chicken Teriyaki Bowl", 12.5), ("Beef Pho", 13.0), ("Veggie Spring Rolls", 6.5),
+    ("Pad Thai", 11.75), ("Miso Soup", 3.5), ("Spicy Tuna Roll", 9.25),
+    ("Bubble Tea", 5.0), ("Kimchi Fried Rice", 10.5), ("Gyoza (6 pcs)", 7.0),
+    ("Mango Sticky Rice", 6.0),
+]
+
+
+def order_payload(orders: int, seed: int = 7) -> bytes:
+    """JSON body shaped like the /history response for ``orders`` orders."""
+    rng = random.Random(seed)
+    rows = []
+    for number in range(orders):
+        items = [rng.choice(DISHES) for _ in range(rng.randint(1, 6))]
+        rows.append({
+            "order_number": f"A{100000 + number}",
+            "restaurant_id": 3,
+            "customer_id": rng.randint(1000, 9999),
+            "status": rng.choice(["complete", "complete", "complete", "cancelled"]),
+            "order_time": f"2024-11-{rng.randint(1, 30):02d}T{rng.randint(10, 21):02d}:{rng.randint(0, 59):02d}:00",
+            "total_price": round(sum(price for _, price in items), 2),
+            "fooditems": [{"food_name": name, "unit_price": price} for name, price in items],
+        })
+    return json.dumps(rows, separators=(",", ":")).encode("utf-8")
+
+
+def _time(fn, data, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(data)
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def codecs():
+    for level in (1, 6, 9):
+        yield f"gzip-{level}", lambda data, level=level: _gzip(data, level)
+    if BROTLI_AVAILABLE:
+        brotli = _load_brotli()
+        for quality in (1, 4, 6, 11):
+            yield f"br-{quality}", lambda data, quality=quality: brotli.compress(data, quality=quality)
+
+
+def _gzip(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if not BROTLI_AVAILABLE:
+        print("brotli not installed; only gzip is measured\n")
+
+    print(f"{'orders':>7} {'codec':<8} {'raw KB':>8} {'wire KB':>8} {'ratio':>6} {'ms':>7} {'MB/s':>7}")
+    for orders in args.orders:
+        data = order_payload(orders)
+        for name, fn in codecs():
+            out, seconds = _time(fn, data, args.repeat)
+            print(
+                f"{orders:>7} {name:<8} {len(data) / 1024:>8.1f} {len(out) / 1024:>8.1f} "
+                f"{len(data) / len(out):>6.1f} {seconds * 1000:>7.2f} {len(data) / seconds / 1e6:>7.0f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Latency of the /foodnames/search lookup on a generated menu.
+
+Builds the in-memory index (utils/menu_search.py) for one restaurant with
+``--items`` dishes, then runs typical prefix, typo, substring and category
+terms against it and reports the build time and per-term latency. No
+database is needed. The process exits non-zero when a term's p95 exceeds the
+budget, so it can be used as a regression gate in CI:
+
+    python -m benchmarks.search --items 3000 --repeat 200 --budget-ms 1
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+
+from utils.menu_search import MenuSearchIndex
+
+STYLES = ["Spicy", "Crispy", "Grilled", "Garlic", "Sweet Chili", "Smoked", "Honey", "Lemon", "Black Pepper", "Sesame"]
+MAINS = ["Chicken", "Beef", "Pork", "Tofu", "Shrimp", "Salmon", "Duck", "Lamb", "Mushroom", "Eggplant"]
+DISHES = ["Teriyaki Bowl", "Fried Rice", "Noodle Soup", "Curry", "Bao", "Skewers", "Salad", "Wrap", "Dumplings", "Stir Fry"]
+CATEGORIES = ["Mains", "Noodles", "Rice", "Soups", "Starters", "Salads", "Desserts", "Drinks", "Specials", "Sides"]
+
+# (kind, term)
+TERMS = [
+    ("prefix", "c"),
+    ("prefix", "chi"),
+    ("prefix", "garlic b"),
+    ("typo", "chiken"),
+    ("typo", "teriyako"),
+    ("substring", "fried rice"),
+    ("category", "dessrt"),
+    ("no match", "zzqx"),
+]
+
+
+def menu_items(items, seed_value=7):
+    """``items`` (food_name, category) rows; names repeat with a #n suffix past the distinct combinations."""
+    rng = random.Random(seed_value)
+    names = [" ".join(parts) for parts in itertools.product(STYLES, MAINS, DISHES)]
+    rng.shuffle(names)
+    return [
+        (names[index] if index < len(names) else f"{names[index % len(names)]} #{index // len(names) + 1}",
+         CATEGORIES[index % len(CATEGORIES)])
+        for index in range(items)
+    ]
+
+
+def measure(index, term, limit, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = index.search(term, limit)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return len(results), timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=3000, help="menu items of the restaurant")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("SEARCH_BUDGET_MS", "1")),
+                        help="p95 budget per term")
+    args = parser.parse_args(argv)
+
+    items = menu_items(args.items)
+    start = time.perf_counter()
+    index = MenuSearchIndex(items)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"{args.items} menu items indexed in {build_ms:.1f} ms; {args.repeat} runs per term\n")
+    print(f"{'kind':<10} {'term':<12} {'rows':>4} {'p50 ms':>7} {'p95 ms':>7} {'max ms':>7}")
+
+    failures = []
+    for kind, term in TERMS:
+        rows, timings = measure(index, term, args.limit, args.repeat)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{kind:<10} {term:<12} {rows:>4} {statistics.median(timings):>7.3f} {p95:>7.3f} {timings[-1]:>7.3f}")
+        if p95 > args.budget_ms:
+            failures.append(f"'{term}' p95 {p95:.3f} ms over the {args.budget_ms} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Cold-start benchmark for ``main:app``.
+
+Measures, in fresh interpreters so nothing is cached between runs:
+
+* per-module import time (via ``python -X importtime``),
+* wall time from interpreter start to the first response served by the app,
+* which heavy libraries got pulled in by importing the app.
+
+The process exits non-zero when a budget is exceeded, so it can be used as a
+regression gate in CI:
+
+    python -m benchmarks.startup --import-budget-ms 400 --first-response-budget-ms 800
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that must only be imported by the endpoints that actually need them
+HEAVY_MODULES = ("pandas", "numpy", "sqlalchemy", "brotli")
+
+# Heavy modules are recorded right after ``import main``: the test client
+# imported afterwards (httpx) pulls in brotli itself when it is installed, and
+# its import is not part of the app's time to first response either
+FIRST_RESPONSE_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+heavy_modules = sorted(m for m in %r if m in sys.modules)
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+requested = time.perf_counter()
+response = client.get("/")
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_response_ms": (imported - start + done - requested) * 1000,
+    "status_code": response.status_code,
+    "heavy_modules": heavy_modules,
+}))
+"""
+
+
+def _run(args):
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def import_times(top=15):
+    """Return the ``top`` slowest modules as (module, self_us, cumulative_us)."""
+    result = _run(["-X", "importtime", "-c", "import main"])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows[:top]
+
+
+def first_response(runs=5):
+    """Return the best-of-``runs`` cold-start timings for ``main:app``."""
+    samples = []
+    for _ in range(runs):
+        result = _run(["-c", FIRST_RESPONSE_SCRIPT % (HEAVY_MODULES,)])
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return min(samples, key=lambda sample: sample["first_response_ms"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--import-budget-ms", type=float,
+                        default=float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "500")))
+    parser.add_argument("--first-response-budget-ms", type=float,
+                        default=float(os.getenv("STARTUP_FIRST_RESPONSE_BUDGET_MS", "1000")))
+    args = parser.parse_args(argv)
+
+    print(f"{'module':<50} {'self ms':>9} {'cumul ms':>9}")
+    for module, self_us, cumulative_us in import_times(args.top):
+        print(f"{module:<50} {self_us / 1000:>9.1f} {cumulative_us / 1000:>9.1f}")
+
+    best = first_response(args.runs)
+    print()
+    print(f"import main:         {best['import_ms']:.1f} ms (budget {args.import_budget_ms:.0f} ms)")
+    print(f"first response:      {best['first_response_ms']:.1f} ms (budget {args.first_response_budget_ms:.0f} ms)")
+    print(f"heavy modules loaded: {', '.join(best['heavy_modules']) or 'none'}")
+
+    failures = []
+    if best["status_code"] != 200:
+        failures.append(f"GET / returned {best['status_code']}")
+    if best["import_ms"] > args.import_budget_ms:
+        failures.append("import time over budget")
+    if best["first_response_ms"] > args.first_response_budget_ms:
+        failures.append("time to first response over budget")
+    if best["heavy_modules"]:
+        failures.append("heavy modules imported at startup: " + ", ".join(best["heavy_modules"]))
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,26 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import test, dbop, photos
+from routers import test, dbop, photos, reports, bulk
+from utils.compression import CompressionMiddleware
+from utils.admission import AdmissionControlMiddleware
+from utils.logging_config import configure_logging, RequestIdMiddleware
+from utils.db_authenticate import ReadYourWritesMiddleware
 
 
+# Queue-backed JSON logging for the whole app, see LOG_* env vars in
+# utils/logging_config.py
+configure_logging()
 
 app = FastAPI()
+# Carries the client's last write position (X-Last-Write / last_write cookie)
+# so its reads skip replicas that have not replayed it, see utils/db_authenticate.py
+app.add_middleware(ReadYourWritesMiddleware)
+# gzip/brotli for large JSON bodies (/history, /order, ...); thresholds and
+# levels come from COMPRESSION_* env vars, see utils/compression.py
+app.add_middleware(CompressionMiddleware)
+# Per route class concurrency limits; sheds excess load with 503 + Retry-After,
+# see ADMISSION_* env vars in utils/admission.py
+app.add_middleware(AdmissionControlMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allows all origins
@@ -12,6 +28,9 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all HTTP methods
     allow_headers=["*"],  # Allows all headers
 )
+# Added last so it is the outermost middleware and every log line of a
+# request, including shed ones, carries its id
+app.add_middleware(RequestIdMiddleware)
 
 
 # routers/test -> /api/test
@@ -21,6 +40,10 @@ app.include_router(dbop.router, prefix="/api")
 
 app.include_router(photos.router, prefix="/api")
 
+app.include_router(reports.router, prefix="/api")
+
+app.include_router(bulk.router, prefix="/api")
+
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,244 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+import csv
+import io
+import logging
+from .dbop import get_current_user, get_restaurant_scope
+from utils.db_authenticate import get_connection, mark_write
+from utils.copy_stream import stream_copy_out, CsvRowReader
+from utils import menu_search
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+MENU_IMPORT_COLUMNS = ("category", "food_name", "food_price", "availability")
+# Per-row errors returned in the response; the total count is always reported
+MAX_REPORTED_ERRORS = 100
+
+
+def _csv_export(query, params, filename):
+    # COPY errors surface here, so the endpoint can still answer with an error
+    # status instead of a 200 cut short
+    connection = get_connection(read_only=True)
+    streaming = False
+    try:
+        cursor = connection.cursor()
+        select = cursor.mogrify(query, params).decode("utf-8")
+        cursor.close()
+        chunks = stream_copy_out(connection, f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)")
+        # From here on the copy thread owns and closes the connection
+        streaming = True
+    finally:
+        if not streaming:
+            connection.close()
+    return StreamingResponse(
+        chunks,
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/export/orders.csv")
+def export_orders(
+    manager_id: int = Depends(get_current_user),
+    status: Optional[str] = Query(None, description="Comma separated statuses to include (default: all)")
+):
+    """Stream the restaurant's orders as CSV straight from COPY, in constant memory."""
+    statuses = tuple(s.strip() for s in status.split(",") if s.strip()) if status else None
+    try:
+        return _csv_export(
+            """
+            SELECT ot.order_number, ot.restaurant_id, ot.status, ot.fooditems
+            FROM order_table ot
+            WHERE ot.restaurant_id IN (
+                SELECT restaurant_id
+                FROM manager_account_table
+                WHERE manager_id = %s
+            )
+            AND (%s OR ot.status IN %s)
+            ORDER BY ot.order_number
+            """,
+            (manager_id, statuses is None, statuses or ("",)),
+            "orders.csv",
+        )
+    except Exception as error:
+        logger.error("Error exporting orders: %s", error)
+        raise HTTPException(status_code=500, detail="Failed to export orders.")
+
+
+@router.get("/export/menu.csv")
+def export_menu(manager_id: int = Depends(get_current_user)):
+    """Stream the restaurant's menu as CSV; the output can be re-imported via /import/menu."""
+    try:
+        return _csv_export(
+            """
+            SELECT category, food_name, food_price, availability
+            FROM menu_table
+            WHERE restaurant_id IN (
+                SELECT restaurant_id
+                FROM manager_account_table
+                WHERE manager_id = %s
+            )
+            ORDER BY category, food_name
+            """,
+            (manager_id,),
+            "menu.csv",
+        )
+    except Exception as error:
+        logger.error("Error exporting menu: %s", error)
+        raise HTTPException(status_code=500, detail="Failed to export menu.")
+
+
+class _ImportErrors:
+    """Per-row import errors: all are counted, only the first MAX_REPORTED_ERRORS are kept."""
+
+    def __init__(self):
+        self.count = 0
+        self.reported = []
+
+    def add(self, line, problems):
+        self.count += 1
+        if len(self.reported) < MAX_REPORTED_ERRORS:
+            self.reported.append({"line": line, "errors": problems})
+
+
+def _validated_menu_rows(reader, errors):
+    """Yield (line, category, food_name, food_price, availability) for valid rows, collecting errors."""
+    seen = set()
+    for row in reader:
+        line = reader.line_num
+        problems = []
+        category = (row.get("category") or "").strip()
+        food_name = (row.get("food_name") or "").strip()
+        availability = (row.get("availability") or "").strip()
+        if not category:
+            problems.append("category is required")
+        if not food_name:
+            problems.append("food_name is required")
+        if not availability:
+            problems.append("availability is required")
+        try:
+            food_price = Decimal((row.get("food_price") or "").strip())
+            if not food_price.is_finite() or food_price < 0:
+                problems.append("food_price must be a non-negative number")
+        except InvalidOperation:
+            problems.append("food_price must be a number")
+        if not problems and (category, food_name) in seen:
+            problems.append(f"duplicate of an earlier row for '{food_name}' in '{category}'")
+
+        if problems:
+            errors.add(line, problems)
+            continue
+        seen.add((category, food_name))
+        yield (line, category, food_name, food_price, availability)
+
+
+@router.post("/import/menu")
+def import_menu(
+    file: UploadFile = File(..., description="CSV with columns: category, food_name, food_price, availability"),
+    restaurant_id: Optional[int] = Form(None, description="Needed only if the manager has several restaurants"),
+    allow_partial: bool = Query(False, description="Import the valid rows even if some rows are invalid"),
+    manager_id: int = Depends(get_current_user)
+):
+    """
+    Bulk insert/update menu items from a CSV upload.
+
+    Rows are validated while they stream through ``COPY FROM STDIN`` into a
+    temporary staging table, which is then merged into menu_table: existing
+    (category, food_name) items get the new price and availability, new ones
+    are inserted. Invalid rows are reported by CSV line number; by default any
+    invalid row aborts the whole import.
+    """
+    scope = get_restaurant_scope(manager_id)
+    if restaurant_id is None and len(scope) == 1:
+        restaurant_id = scope[0]
+    if restaurant_id not in scope:
+        raise HTTPException(status_code=400, detail="restaurant_id is missing or not managed by you.")
+
+    errors = _ImportErrors()
+    try:
+        text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+        reader = csv.DictReader(text)
+        missing = [column for column in MENU_IMPORT_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"CSV is missing columns: {', '.join(missing)}")
+
+        connection = get_connection()
+        cursor = connection.cursor()
+
+        cursor.execute(
+            """
+            CREATE TEMP TABLE menu_import (
+                line integer,
+                category text,
+                food_name text,
+                food_price numeric,
+                availability text
+            ) ON COMMIT DROP
+            """
+        )
+        cursor.copy_expert(
+            "COPY menu_import (line, category, food_name, food_price, availability) FROM STDIN WITH (FORMAT csv)",
+            CsvRowReader(_validated_menu_rows(reader, errors)),
+        )
+
+        if errors.count and not allow_partial:
+            connection.rollback()
+            cursor.close()
+            connection.close()
+            raise HTTPException(
+                status_code=422,
+                detail={
+                    "message": "No rows were imported because some rows are invalid.",
+                    "error_count": errors.count,
+                    "errors": errors.reported,
+                },
+            )
+
+        cursor.execute(
+            """
+            UPDATE menu_table m
+            SET food_price = s.food_price, availability = s.availability
+            FROM menu_import s
+            WHERE m.restaurant_id = %s AND m.category = s.category AND m.food_name = s.food_name
+            """,
+            (restaurant_id,)
+        )
+        updated = cursor.rowcount
+
+        cursor.execute(
+            """
+            INSERT INTO menu_table (restaurant_id, category, food_name, food_price, availability)
+            SELECT %s, s.category, s.food_name, s.food_price, s.availability
+            FROM menu_import s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM menu_table m
+                WHERE m.restaurant_id = %s AND m.category = s.category AND m.food_name = s.food_name
+            )
+            ORDER BY s.line
+            """,
+            (restaurant_id, restaurant_id)
+        )
+        inserted = cursor.rowcount
+
+        connection.commit()
+        mark_write(connection)
+        menu_search.invalidate(restaurant_id)
+        cursor.close()
+        connection.close()
+
+        return {
+            "message": "Menu imported successfully!",
+            "inserted": inserted,
+            "updated": updated,
+            "error_count": errors.count,
+            "errors": errors.reported,
+        }
+    except HTTPException:
+        raise
+    except Exception as error:
+        logger.error("Error importing menu: %s", error)
+        raise HTTPException(status_code=400, detail=f"Failed to import menu: {str(error)}")
@@ -1,19 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import pandas as pd
 import logging
 import os
-import psycopg2
+import time
+from typing import Optional
 from dotenv import load_dotenv
 import hashlib 
 from .auth import create_access_token, verify_token 
-from utils.db_authenticate import get_db
+from utils.db_authenticate import get_connection, get_read_db, mark_write, read_after
+from utils.singleflight import SingleFlight
+from utils.rollups import CLOSED_STATUSES, apply_order
+from utils import menu_search
+from utils.order_queries import ACTIVE_ORDER_STATUSES, ACTIVE_ORDERS_QUERY, CHANGED_ORDERS_QUERY, ORDER_CURSOR_QUERY
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Query
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Logging is configured once in main.py (utils/logging_config.py)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -55,7 +60,6 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 def get_current_user(token: str = Depends(oauth2_scheme)):
     payload = verify_token(token)
     manager_id = payload.get("manager_id")
-    print(manager_id)
     if manager_id is None:
         raise HTTPException(status_code=401, detail="Invalid user")
     return manager_id
@@ -64,17 +68,46 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode('utf-8')).hexdigest() 
 
+# Kitchen screens and tablets of one restaurant poll these at the same time;
+# identical concurrent polls share one query and one serialized response
+order_flight = SingleFlight("/order")
+menu_food_flight = SingleFlight("/menus/food")
+restaurant_flight = SingleFlight("/restaurant")
+COALESCED_READS = (order_flight, menu_food_flight, restaurant_flight, menu_search.index_flight)
+
+# manager_id -> (expires_at, restaurant ids); managers rarely change restaurant
+RESTAURANT_SCOPE_TTL_SECONDS = 300
+_restaurant_scopes = {}
+
+def get_restaurant_scope(manager_id):
+    """Restaurant ids visible to a manager, cached; used to key coalesced reads."""
+    now = time.monotonic()
+    cached = _restaurant_scopes.get(manager_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    connection = get_connection(read_only=True)
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT restaurant_id FROM manager_account_table WHERE manager_id = %s ORDER BY restaurant_id",
+        (manager_id,)
+    )
+    scope = tuple(record[0] for record in cursor.fetchall())
+    cursor.close()
+    connection.close()
+
+    _restaurant_scopes[manager_id] = (now + RESTAURANT_SCOPE_TTL_SECONDS, scope)
+    return scope
+
+# Serialize exactly like FastAPI would for a returned value
+def json_body(content) -> bytes:
+    return JSONResponse(content=jsonable_encoder(content)).body
+
 # Registration endpoint
 @router.post("/register")
-async def register(user: User):
+def register(user: User):
     try:
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Hash the password before storing it
@@ -86,6 +119,7 @@ async def register(user: User):
             (user.username, hashed_password, user.restaurant_id, user.manager_id) 
         )
         connection.commit()
+        mark_write(connection)
 
         cursor.close()
         connection.close()
@@ -96,15 +130,9 @@ async def register(user: User):
 
 # Login endpoint
 @router.post("/login")
-async def login(user: Login): 
+def login(user: Login): 
     try:
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Validate user credentials
@@ -132,8 +160,13 @@ async def test_route():
     logger.debug("This is a debug message")
     return {"message": "This is the dbop test route"}
 
+@router.get("/dbop/coalescing")
+def get_coalescing_stats(manager_id: int = Depends(get_current_user)):
+    """Per route: queries executed vs. requests that joined an in-flight query."""
+    return {flight.name: flight.stats() for flight in COALESCED_READS}
+
 @router.get("/dbop/get_selected_results")
-async def get_selected_results(query: str, cursor=Depends(get_db)):
+def get_selected_results(query: str, cursor=Depends(get_read_db)):
     try:
         
         if not query.strip().lower().startswith("select"):
@@ -142,12 +175,12 @@ async def get_selected_results(query: str, cursor=Depends(get_db)):
         # Execute the query
         cursor.execute(query)
 
-        # Fetch results and convert to a DataFrame
+        # Fetch results and map each row to a column -> value dict
         records = cursor.fetchall()
         column_names = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(records, columns=column_names)
+        rows = [dict(zip(column_names, record)) for record in records]
 
-        return df.to_dict(orient="records")  # Converts DataFrame to JSON-compatible format
+        return rows
 
     except ValueError as ve:
         logger.error("Validation Error: %s", ve)
@@ -159,15 +192,9 @@ async def get_selected_results(query: str, cursor=Depends(get_db)):
     
     
 @router.get("/menus")
-async def get_menus(manager_id: int = Depends(get_current_user)):
+def get_menus(manager_id: int = Depends(get_current_user)):
     try:
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection(read_only=True)
         cursor = connection.cursor()
 
         # Assume the table structure and logic is correct
@@ -185,12 +212,12 @@ async def get_menus(manager_id: int = Depends(get_current_user)):
 
         records = cursor.fetchall()
         column_names = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(records, columns=column_names)
+        rows = [dict(zip(column_names, record)) for record in records]
 
         cursor.close()
         connection.close()
 
-        return df.to_dict(orient="records")
+        return rows
     except Exception as error:
         logger.error("Error fetching menus: %s", error)
         raise HTTPException(status_code=500, detail="Failed to fetch menus.")
@@ -198,19 +225,13 @@ async def get_menus(manager_id: int = Depends(get_current_user)):
     
     
 @router.get("/menus/food")
-async def get_menus(
+def get_menus(
     manager_id: int = Depends(get_current_user), 
     category: str = Query(..., description="The category of food items to fetch")
 ):
-    try:
+    def fetch():
         # Establish database connection
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection(read_only=True)
         cursor = connection.cursor()
 
         cursor.execute(
@@ -229,77 +250,179 @@ async def get_menus(
         # Fetch and format results
         records = cursor.fetchall()
         column_names = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(records, columns=column_names)
+        rows = [dict(zip(column_names, record)) for record in records]
         
         cursor.close()
         connection.close()
 
-        return df.to_dict(orient="records")  # Return as list of dictionaries
+        return json_body(rows)  # Serialized once, shared by coalesced requests
+
+    try:
+        key = (get_restaurant_scope(manager_id), read_after(), category)
+        return Response(content=menu_food_flight.do(key, fetch), media_type="application/json")
     except Exception as error:
         logger.error("Error fetching menus: %s", error)
         raise HTTPException(status_code=500, detail="Failed to fetch menus.")
     
     
-@router.get("/order")
-async def get_order(manager_id: int = Depends(get_current_user)):
+MENU_SNAPSHOT_FIELDS = ["food_name", "food_price", "availability", "photo_id"]
+
+@router.get("/menus/snapshot")
+def get_menu_snapshot(
+    manager_id: int = Depends(get_current_user),
+    compact: bool = Query(False, description="Return items as arrays in the order given by 'fields'")
+):
+    """
+    The manager's whole menu in one round trip: every category with its items'
+    price, availability and photo reference, built from a single query.
+
+    Default shape:
+        {"categories": [{"category": ..., "items": [{"food_name": ..., ...}]}]}
+    Compact shape (no repeated keys, for large menus):
+        {"fields": [...], "categories": {"<category>": [[food_name, food_price, availability, photo_id], ...]}}
+
+    photo_id can be fetched from /restaurant/photo/{photo_id}; it is null when
+    the dish has no photo.
+    """
     try:
-        # Establish database connection
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection(read_only=True)
         cursor = connection.cursor()
 
         cursor.execute(
             """
-            SELECT 
-                ot.*,
-                json_agg(json_build_object(
-                    'food_name', elem ->> 'food_name',
-                    'unit_price', (elem ->> 'unit_price')::numeric
-                )) AS fooditems
-            FROM order_table ot
-            LEFT JOIN LATERAL jsonb_array_elements(ot.fooditems) AS elem ON true
-            WHERE ot.restaurant_id IN (
+            SELECT m.category, m.food_name, m.food_price, m.availability, p.photo_id
+            FROM menu_table m
+            LEFT JOIN LATERAL (
+                SELECT photo_id
+                FROM restaurant_photos rp
+                WHERE rp.restaurant_id = m.restaurant_id AND rp.food_name = m.food_name
+                ORDER BY photo_id
+                LIMIT 1
+            ) p ON true
+            WHERE m.restaurant_id IN (
                 SELECT restaurant_id 
                 FROM manager_account_table 
                 WHERE manager_id = %s
             )
-            AND ot.status IN ('new', 'prepare')
-            GROUP BY ot.order_number
-            ORDER BY ot.order_number;
+            ORDER BY m.category, m.food_name
             """,
             (manager_id,)
         )
 
-        # Fetch and format results
         records = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(records, columns=column_names)
+
+        cursor.close()
+        connection.close()
+
+        # Rows arrive sorted by category, so each category is one contiguous run
+        categories = {}
+        for category, *item in records:
+            categories.setdefault(category, []).append(item)
+
+        if compact:
+            return {"fields": MENU_SNAPSHOT_FIELDS, "categories": categories}
+
+        return {
+            "categories": [
+                {
+                    "category": category,
+                    "items": [dict(zip(MENU_SNAPSHOT_FIELDS, item)) for item in items],
+                }
+                for category, items in categories.items()
+            ]
+        }
+    except Exception as error:
+        logger.error("Error fetching menu snapshot: %s", error)
+        raise HTTPException(status_code=500, detail="Failed to fetch menu snapshot.")
+    
+    
+# Bookkeeping columns of order_table that are not part of the order payload
+ORDER_INTERNAL_COLUMNS = ("change_seq", "changed_at", "closed_at")
+
+
+def _order_rows(cursor):
+    column_names = [desc[0] for desc in cursor.description]
+    return [
+        {name: value for name, value in zip(column_names, record) if name not in ORDER_INTERNAL_COLUMNS}
+        for record in cursor.fetchall()
+    ]
+
+# Sequence values are drawn before commit, so a change can become visible
+# after a higher one. Cursors never move past changes younger than this;
+# those are re-sent until they settle, then polls return nothing.
+ORDER_SYNC_GRACE_SECONDS = float(os.getenv("ORDER_SYNC_GRACE_SECONDS", "2"))
+
+def _order_cursor(cursor, manager_id, since):
+    """Highest change_seq a client can safely resume from (see ORDER_SYNC_GRACE_SECONDS)."""
+    cursor.execute(
+        ORDER_CURSOR_QUERY,
+        {"manager_id": manager_id, "since": since, "grace_seconds": ORDER_SYNC_GRACE_SECONDS}
+    )
+    high, settling = cursor.fetchone()
+    return settling - 1 if settling is not None else high
+
+@router.get("/order")
+def get_order(
+    manager_id: int = Depends(get_current_user),
+    since: Optional[int] = Query(None, description="Cursor from a previous response; only changes after it are returned")
+):
+    """
+    Active ('new' / 'prepare') orders of the manager's restaurant.
+
+    Without ``since`` returns the full list, with the cursor to poll from in
+    the X-Order-Cursor header. With ``since`` returns only what changed:
+        {"cursor": ..., "orders": [<inserted or updated active orders>],
+         "removed": [{"order_number": ..., "status": ...}]}
+    where ``removed`` lists orders that left the active set.
+    """
+    def fetch():
+        # Establish database connection
+        connection = get_connection()
+        cursor = connection.cursor()
+
+        cursor.execute(
+            ACTIVE_ORDERS_QUERY if since is None else CHANGED_ORDERS_QUERY,
+            {"manager_id": manager_id, "since": since, "active_statuses": ACTIVE_ORDER_STATUSES}
+        )
+
+        # Fetch and format results
+        rows = _order_rows(cursor)
+
+        next_cursor = _order_cursor(cursor, manager_id, since or 0)
         
         cursor.close()
         connection.close()
 
-        return df.to_dict(orient="records") 
+        if since is None:
+            return json_body(rows), next_cursor
+
+        return json_body({
+            "cursor": next_cursor,
+            "orders": [row for row in rows if row["status"] in ACTIVE_ORDER_STATUSES],
+            "removed": [
+                {"order_number": row["order_number"], "status": row["status"]}
+                for row in rows if row["status"] not in ACTIVE_ORDER_STATUSES
+            ],
+        }), next_cursor
+
+    try:
+        key = (get_restaurant_scope(manager_id), since)
+        body, next_cursor = order_flight.do(key, fetch)
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={"X-Order-Cursor": str(next_cursor)}
+        )
     except Exception as error:
         logger.error("Error fetching menus: %s", error)
         raise HTTPException(status_code=500, detail="Failed to fetch menus.")
     
     
 @router.get("/history")
-async def get_order(manager_id: int = Depends(get_current_user)):
+def get_order(manager_id: int = Depends(get_current_user)):
     try:
         # Establish database connection
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection(read_only=True)
         cursor = connection.cursor()
 
         cursor.execute(
@@ -325,14 +448,12 @@ async def get_order(manager_id: int = Depends(get_current_user)):
         )
 
         # Fetch and format results
-        records = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        df = pd.DataFrame(records, columns=column_names)
+        rows = _order_rows(cursor)
         
         cursor.close()
         connection.close()
 
-        return df.to_dict(orient="records")  # Return as list of dictionaries
+        return rows  # Return as list of dictionaries
     except Exception as error:
         logger.error("Error fetching menus: %s", error)
         raise HTTPException(status_code=500, detail="Failed to fetch menus.")
@@ -343,16 +464,10 @@ async def get_order(manager_id: int = Depends(get_current_user)):
 
 # PUT endpoint to update menu availability
 @router.put("/menus/availability")
-async def update_menu_availability(item: UpdateMenuAvailability, manager_id: int = Depends(get_current_user)):
+def update_menu_availability(item: UpdateMenuAvailability, manager_id: int = Depends(get_current_user)):
     try:
         # Establish database connection
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Combined SQL query to update availability based on category and check food name
@@ -379,6 +494,7 @@ async def update_menu_availability(item: UpdateMenuAvailability, manager_id: int
         actual_food_name = result[0]
         
         connection.commit()
+        mark_write(connection)
         cursor.close()
         connection.close()
 
@@ -391,16 +507,10 @@ async def update_menu_availability(item: UpdateMenuAvailability, manager_id: int
         raise HTTPException(status_code=400, detail=f"Failed to update menu availability: {str(e)}")
     
 @router.put("/menus/update-availability")  # Updated endpoint path
-async def update_menu_by_category(item: UpdateMenuByCategory, manager_id: int = Depends(get_current_user)):
+def update_menu_by_category(item: UpdateMenuByCategory, manager_id: int = Depends(get_current_user)):
     try:
         # Establish database connection
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection()
         cursor = connection.cursor()
 
         # SQL query to update availability for all items in the specified category
@@ -426,6 +536,7 @@ async def update_menu_by_category(item: UpdateMenuByCategory, manager_id: int =
         food_names = [result[0] for result in results] 
         
         connection.commit()
+        mark_write(connection)
         cursor.close()
         connection.close()
 
@@ -438,35 +549,54 @@ async def update_menu_by_category(item: UpdateMenuByCategory, manager_id: int =
         raise HTTPException(status_code=400, detail=f"Failed to update menu availability: {str(e)}")
     
 @router.put("/order/update-status")
-async def update_order_status(order: UpdateOrderStatus, manager_id: int = Depends(get_current_user)):
+def update_order_status(order: UpdateOrderStatus, manager_id: int = Depends(get_current_user)):
     try:
         # Establish database connection
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection()
         cursor = connection.cursor()
 
-        # SQL query to update order status based on order_number
+        # Lock the order so concurrent status changes can't double count it in the rollups
+        cursor.execute(
+            "SELECT status FROM public.order_table WHERE order_number = %s FOR UPDATE",
+            (order.order_number,)
+        )
+        current = cursor.fetchone()
+        status_changed = current is not None and current[0] != order.status
+
+        # A closed order that changes status leaves the bucket it was counted in
+        if status_changed and current[0] in CLOSED_STATUSES:
+            apply_order(cursor, order.order_number, -1)
+
+        # SQL query to update order status based on order_number; closed_at
+        # records when the order entered 'complete' / 'cancelled'. Only a real
+        # status change is a change for /order?since= pollers.
         cursor.execute(
             """
             UPDATE public.order_table
-            SET status = %s
+            SET status = %s,
+                change_seq = CASE WHEN %s THEN nextval('order_change_seq') ELSE change_seq END,
+                changed_at = CASE WHEN %s THEN clock_timestamp() ELSE changed_at END,
+                closed_at = CASE
+                    WHEN NOT %s THEN closed_at
+                    WHEN %s IN %s THEN now()
+                    ELSE NULL
+                END
             WHERE order_number = %s
             RETURNING order_number, status
             """,
-            (order.status, order.order_number)
+            (order.status, status_changed, status_changed, status_changed, order.status, CLOSED_STATUSES, order.order_number)
         )
         
         updated_order = cursor.fetchone()
 
         if updated_order is None:
             raise HTTPException(status_code=404, detail="Order not found or status could not be updated.")
+
+        if status_changed and order.status in CLOSED_STATUSES:
+            apply_order(cursor, order.order_number, 1)
         
         connection.commit()
+        mark_write(connection)
         cursor.close()
         connection.close()
 
@@ -480,7 +610,7 @@ async def update_order_status(order: UpdateOrderStatus, manager_id: int = Depend
     
     
 @router.get("/restaurant")
-async def get_restaurant_by_manager(manager_id: int = Depends(get_current_user)):
+def get_restaurant_by_manager(manager_id: int = Depends(get_current_user)):
     """
     Fetch restaurant details based on the manager ID.
 
@@ -490,15 +620,9 @@ async def get_restaurant_by_manager(manager_id: int = Depends(get_current_user))
     Returns:
         dict: Restaurant details including restaurant_id, name, ratings, type, and pricing levels.
     """
-    try:
+    def fetch():
         # Establish database connection
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection(read_only=True)
         cursor = connection.cursor()
 
         # Updated SQL query to fetch required restaurant details
@@ -536,8 +660,11 @@ async def get_restaurant_by_manager(manager_id: int = Depends(get_current_user))
         cursor.close()
         connection.close()
 
-        return restaurant_details
+        return json_body(restaurant_details)
 
+    try:
+        key = (get_restaurant_scope(manager_id), read_after())
+        return Response(content=restaurant_flight.do(key, fetch), media_type="application/json")
     except Exception as error:
         logger.error("Error fetching restaurant details: %s", error)
         raise HTTPException(
@@ -547,15 +674,9 @@ async def get_restaurant_by_manager(manager_id: int = Depends(get_current_user))
 
 
 @router.get("/foodnames")
-async def get_food_names(manager_id: int = Depends(get_current_user)):
+def get_food_names(manager_id: int = Depends(get_current_user)):
     try:
-        connection = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user="developuser",
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+        connection = get_connection(read_only=True)
         cursor = connection.cursor()
         cursor.execute(
             """
@@ -583,4 +704,36 @@ async def get_food_names(manager_id: int = Depends(get_current_user)):
         raise HTTPException(
             status_code=500, 
             detail="Failed to fetch food names."
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/foodnames/search")
+def search_food_names(
+    manager_id: int = Depends(get_current_user),
+    q: str = Query(..., min_length=1, max_length=100, description="Prefix or (misspelled) part of a dish or category name"),
+    limit: int = Query(10, ge=1, le=menu_search.SEARCH_MAX_RESULTS, description="Maximum number of results")
+):
+    """
+    Autocomplete over the restaurant's dish names and categories.
+
+    Answered from the per-restaurant in-memory index of utils/menu_search.py.
+    Dishes whose name starts with ``q`` come first, then the rest by the share
+    of ``q``'s trigrams found in the dish name or category, which also catches
+    substrings and typos ("chiken" -> "Chicken Teriyaki Bowl").
+    """
+    term = q.strip()
+    if not term:
+        raise HTTPException(status_code=422, detail="q must not be blank.")
+    try:
+        results = [
+            {"food_name": food_name, "category": category, "score": round(score, 3)}
+            for _, score, food_name, category in menu_search.search(get_restaurant_scope(manager_id), term, limit)
+        ]
+
+        return {"query": term, "results": results}
+    except Exception as error:
+        logger.error("Error searching food names: %s", error)
+        raise HTTPException(
+            status_code=500, 
+            detail="Failed to search food names."
+        )
@@ -1,14 +1,12 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
 from fastapi.security import OAuth2PasswordBearer
 from dotenv import load_dotenv
-import psycopg2
-import os
 import logging
 from .auth import verify_token  # Ensure this is the correct path
+from utils.db_authenticate import get_connection, mark_write
 import base64
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Logging is configured once in main.py (utils/logging_config.py)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -30,7 +28,7 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
 
 # Endpoint for uploading photos
 @router.post("/restaurant/upload-photo")
-async def upload_photo(
+def upload_photo(
     restaurant_id: int = Form(...),
     food_name: str = Form(...),  # Added food_name to ensure unique records
     description: str = Form(None),
@@ -38,17 +36,11 @@ async def upload_photo(
     manager_id: int = Depends(get_current_user)
 ):
     try:
-        logger.debug(f"Manager ID: {manager_id}, Restaurant ID: {restaurant_id}, File: {file.filename}")
+        logger.debug("Manager ID: %s, Restaurant ID: %s, File: %s", manager_id, restaurant_id, file.filename)
 
-        file_content = await file.read()
+        file_content = file.file.read()
 
-        connection = psycopg2.connect(
-            host="34.123.21.31",
-            database="quefoodhall",
-            user="developuser",
-            password="]&l381[czY:F@sV*",
-            port=5432,
-        )
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Check if the photo already exists
@@ -70,7 +62,7 @@ async def upload_photo(
                 """,
                 (description, file_content, file.filename, file.content_type, restaurant_id, food_name)
             )
-            logger.info(f"Updated photo for {food_name} in restaurant {restaurant_id}")
+            logger.info("Updated photo for %s in restaurant %s", food_name, restaurant_id)
             message = "Photo updated successfully!"
         else:
             # If no photo exists, insert a new one
@@ -81,32 +73,27 @@ async def upload_photo(
                 """,
                 (restaurant_id, food_name, description, file_content, file.filename, file.content_type)
             )
-            logger.info(f"Inserted new photo for {food_name} in restaurant {restaurant_id}")
+            logger.info("Inserted new photo for %s in restaurant %s", food_name, restaurant_id)
             message = "Photo uploaded successfully!"
 
         connection.commit()
+        mark_write(connection)
         cursor.close()
         connection.close()
 
         return {"message": message}
 
     except Exception as e:
-        logger.error(f"Error uploading photo: {str(e)}")
+        logger.error("Error uploading photo: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to upload photo: {str(e)}")
 
 
 # GET endpoint to retrieve a photo's metadata
 @router.get("/restaurant/photo/{photo_id}")
-async def get_photo(photo_id: int, manager_id: int = Depends(get_current_user)):
+def get_photo(photo_id: int, manager_id: int = Depends(get_current_user)):
     try:
         # Connect to the database
-        connection = psycopg2.connect(
-            host="34.123.21.31",
-            database="quefoodhall",
-            user="developuser",
-            password="]&l381[czY:F@sV*",
-            port=5432,
-        )
+        connection = get_connection(read_only=True)
         cursor = connection.cursor()
 
         # Fetch the photo record
@@ -142,19 +129,13 @@ async def get_photo(photo_id: int, manager_id: int = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=f"Failed to fetch photo: {str(e)}")
     
 @router.get("/restaurant/photo")
-async def get_photo(food_name: str, manager_id: int = Depends(get_current_user)):
+def get_photo(food_name: str, manager_id: int = Depends(get_current_user)):
     """
     Fetch a photo record based on food_name and restaurant_id (from manager_id).
     """
     try:
         # Connect to the database
-        connection = psycopg2.connect(
-            host="34.123.21.31",
-            database="quefoodhall",
-            user="developuser",
-            password="]&l381[czY:F@sV*",
-            port=5432,
-        )
+        connection = get_connection(read_only=True)
         cursor = connection.cursor()
 
         # Fetch the photo record based on restaurant_id and food_name
@@ -191,7 +172,7 @@ async def get_photo(food_name: str, manager_id: int = Depends(get_current_user))
         raise HTTPException(status_code=500, detail=f"Failed to fetch photo: {str(e)}")
 
 @router.delete("/restaurant/photo/{photo_id}")
-async def delete_photo(
+def delete_photo(
     photo_id: int, 
     manager_id: int = Depends(get_current_user)  # Validate manager
 ):
@@ -200,16 +181,10 @@ async def delete_photo(
     """
     try:
         # Log the request
-        logger.debug(f"Manager ID: {manager_id}, Photo ID to delete: {photo_id}")
+        logger.debug("Manager ID: %s, Photo ID to delete: %s", manager_id, photo_id)
 
         # Connect to the PostgreSQL database
-        connection = psycopg2.connect(
-            host="34.123.21.31",
-            database="quefoodhall",
-            user="developuser",
-            password="]&l381[czY:F@sV*",
-            port=5432,
-        )
+        connection = get_connection()
         cursor = connection.cursor()
 
         # Attempt to delete the photo
@@ -223,7 +198,7 @@ async def delete_photo(
 
         # Check if any row was affected (i.e., if the photo existed)
         if cursor.rowcount == 0:
-            logger.warning(f"No photo found with ID {photo_id}.")
+            logger.warning("No photo found with ID %s.", photo_id)
             raise HTTPException(
                 status_code=404, 
                 detail=f"Photo with ID {photo_id} not found."
@@ -231,9 +206,10 @@ async def delete_photo(
 
         # Commit the deletion
         connection.commit()
+        mark_write(connection)
 
         # Log success and close the connection
-        logger.info(f"Photo with ID {photo_id} deleted successfully.")
+        logger.info("Photo with ID %s deleted successfully.", photo_id)
         cursor.close()
         connection.close()
 
@@ -243,5 +219,5 @@ async def delete_photo(
         raise http_exc
     except Exception as e:
         # Log any other errors and return a generic 500
-        logger.error(f"Error deleting photo: {str(e)}")
+        logger.error("Error deleting photo: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to delete photo: {str(e)}")
\ No newline at end of file
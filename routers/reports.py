@@ -0,0 +1,119 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from datetime import date, timedelta
+from typing import Literal, Optional
+import logging
+from .dbop import get_current_user
+from utils.db_authenticate import get_connection
+from utils.rollups import REPORT_TIME_ZONE
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Days and hours are local to REPORT_TIME_ZONE, like the rollup buckets;
+# nothing depends on the session's or the server's time zone
+REPORT_QUERIES = {
+    "day": """
+        SELECT (bucket AT TIME ZONE %(time_zone)s)::date AS day, SUM(order_count) AS order_count, SUM(revenue) AS revenue
+        FROM sales_hourly_rollup
+        WHERE restaurant_id IN (
+            SELECT restaurant_id
+            FROM manager_account_table
+            WHERE manager_id = %(manager_id)s
+        )
+        AND status = %(status)s
+        AND bucket >= %(start)s::timestamp AT TIME ZONE %(time_zone)s
+        AND bucket < %(end)s::timestamp AT TIME ZONE %(time_zone)s
+        GROUP BY 1
+        ORDER BY 1
+    """,
+    "hour": """
+        SELECT bucket AT TIME ZONE %(time_zone)s AS hour, SUM(order_count) AS order_count, SUM(revenue) AS revenue
+        FROM sales_hourly_rollup
+        WHERE restaurant_id IN (
+            SELECT restaurant_id
+            FROM manager_account_table
+            WHERE manager_id = %(manager_id)s
+        )
+        AND status = %(status)s
+        AND bucket >= %(start)s::timestamp AT TIME ZONE %(time_zone)s
+        AND bucket < %(end)s::timestamp AT TIME ZONE %(time_zone)s
+        GROUP BY 1
+        ORDER BY 1
+    """,
+    "dish": """
+        SELECT food_name, SUM(quantity) AS quantity, SUM(order_count) AS order_count, SUM(revenue) AS revenue
+        FROM sales_dish_rollup
+        WHERE restaurant_id IN (
+            SELECT restaurant_id
+            FROM manager_account_table
+            WHERE manager_id = %(manager_id)s
+        )
+        AND status = %(status)s AND day >= %(start)s AND day < %(end)s
+        GROUP BY 1
+        ORDER BY revenue DESC, food_name
+    """,
+}
+
+# Today in REPORT_TIME_ZONE, from the database clock like the buckets
+TODAY_QUERY = "SELECT (now() AT TIME ZONE %(time_zone)s)::date"
+
+
+@router.get("/reports/sales")
+def get_sales_report(
+    manager_id: int = Depends(get_current_user),
+    group_by: Literal["day", "hour", "dish"] = Query("day", description="Aggregate per day, hour or dish"),
+    start: Optional[date] = Query(None, description="First day included (default: 30 days before end)"),
+    end: Optional[date] = Query(None, description="Last day included (default: today in REPORT_TIME_ZONE)"),
+    status: Literal["complete", "cancelled"] = Query("complete", description="Which closed orders to count"),
+):
+    """
+    Revenue and order counts for the manager's restaurant, read from the
+    sales rollup tables (see utils/rollups.py), so the cost depends on the
+    date range rather than on the size of the order history. Days and hours
+    are local to REPORT_TIME_ZONE.
+    """
+    try:
+        connection = get_connection(read_only=True)
+        cursor = connection.cursor()
+
+        if end is None:
+            cursor.execute(TODAY_QUERY, {"time_zone": REPORT_TIME_ZONE})
+            end = cursor.fetchone()[0]
+        start = start or end - timedelta(days=30)
+        if start > end:
+            cursor.close()
+            connection.close()
+            raise HTTPException(status_code=400, detail="start must not be after end.")
+
+        cursor.execute(
+            REPORT_QUERIES[group_by],
+            {
+                "manager_id": manager_id,
+                "status": status,
+                "start": start,
+                "end": end + timedelta(days=1),
+                "time_zone": REPORT_TIME_ZONE,
+            }
+        )
+
+        records = cursor.fetchall()
+        column_names = [desc[0] for desc in cursor.description]
+        rows = [dict(zip(column_names, record)) for record in records]
+
+        cursor.close()
+        connection.close()
+
+        return {
+            "group_by": group_by,
+            "status": status,
+            "start": start,
+            "end": end,
+            "time_zone": REPORT_TIME_ZONE,
+            "rows": rows,
+        }
+    except HTTPException:
+        raise
+    except Exception as error:
+        logger.error("Error fetching sales report: %s", error)
+        raise HTTPException(status_code=500, detail="Failed to fetch sales report.")
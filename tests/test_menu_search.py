@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from benchmarks import search as search_benchmark
+from utils import menu_search
+from utils.menu_search import MenuSearchIndex
+
+MENU = [
+    ("Chicken Teriyaki Bowl", "Mains"),
+    ("Chili Oil Dumplings", "Starters"),
+    ("Crispy Chicken Wrap", "Mains"),
+    ("Mango Sticky Rice", "Desserts"),
+    ("Vegetable Fried Rice", "Rice"),
+]
+
+
+def names(results):
+    return [food_name for _, _, food_name, _ in results]
+
+
+def test_prefix_matches_come_first():
+    results = MenuSearchIndex(MENU).search("chi", 10)
+    assert names(results) == ["Chicken Teriyaki Bowl", "Chili Oil Dumplings", "Crispy Chicken Wrap"]
+    assert [prefix_match for prefix_match, *_ in results] == [True, True, False]
+
+
+def test_typos_substrings_and_categories_match():
+    index = MenuSearchIndex(MENU)
+    assert names(index.search("chiken", 10)) == ["Chicken Teriyaki Bowl", "Crispy Chicken Wrap"]
+    assert names(index.search("fried rice", 10))[0] == "Vegetable Fried Rice"
+    assert names(index.search("dessrt", 10)) == ["Mango Sticky Rice"]
+    assert index.search("zzqx", 10) == []
+
+
+def test_results_are_capped():
+    assert len(MenuSearchIndex(MENU).search("c", 2)) == 2
+
+
+def test_invalidate_rebuilds_the_index(monkeypatch):
+    menus = {1: MENU[:1]}
+    monkeypatch.setattr(menu_search, "_build", lambda restaurant_id: MenuSearchIndex(menus[restaurant_id]))
+    monkeypatch.setattr(menu_search, "_indexes", {})
+    assert names(menu_search.search((1,), "mango", 10)) == []
+
+    menus[1] = MENU
+    assert names(menu_search.search((1,), "mango", 10)) == []
+    menu_search.invalidate(1)
+    assert names(menu_search.search((1,), "mango", 10)) == ["Mango Sticky Rice"]
+
+
+def test_lookups_within_budget():
+    # Budget comes from SEARCH_BUDGET_MS
+    assert search_benchmark.main([]) == 0
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from utils import migrations
+
+# A disposable database with the application's tables; migrations are applied
+# to it, the seeded rows are rolled back
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+def test_hot_queries_use_their_indexes():
+    connection = psycopg2.connect(TEST_DATABASE_URL)
+    try:
+        migrations.upgrade(connection)
+        cursor = connection.cursor()
+        params = migrations.seed(cursor)
+        cursor.close()
+        assert migrations.explain(connection, params) == []
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT count(*) FROM manager_account_table WHERE manager_account_name LIKE 'explain-%'")
+        assert cursor.fetchone()[0] == 0
+        cursor.close()
+    finally:
+        connection.close()
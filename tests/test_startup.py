@@ -0,0 +1,10 @@
+import pytest
+
+pytest.importorskip("fastapi")
+
+from benchmarks import startup
+
+
+def test_startup_within_budget():
+    # Budgets come from STARTUP_IMPORT_BUDGET_MS / STARTUP_FIRST_RESPONSE_BUDGET_MS
+    assert startup.main([]) == 0
@@ -0,0 +1,138 @@
+import os
+import json
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Concurrent requests allowed per route class; each one holds a database
+# connection, so the sum bounds the connections a process can open.
+ADMISSION_READ_LIMIT = int(os.getenv("ADMISSION_READ_LIMIT", "20"))
+ADMISSION_WRITE_LIMIT = int(os.getenv("ADMISSION_WRITE_LIMIT", "10"))
+ADMISSION_PHOTO_LIMIT = int(os.getenv("ADMISSION_PHOTO_LIMIT", "4"))
+# CSV exports hold their connection for the whole download
+ADMISSION_EXPORT_LIMIT = int(os.getenv("ADMISSION_EXPORT_LIMIT", "2"))
+# Requests allowed to wait for a slot per class, and for how long
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "50"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+PHOTO_PATHS = ("/api/restaurant/upload-photo", "/api/restaurant/photo")
+EXPORT_PATHS = ("/api/export/",)
+READ_METHODS = ("GET", "HEAD")
+
+
+class Limiter:
+    """Concurrency limit with a bounded wait queue and a wait deadline."""
+
+    def __init__(self, name, limit, queue_size, timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> bool:
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.queue_size:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                return False
+            finally:
+                self.waiting -= 1
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "shed": self.shed,
+        }
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware that bounds concurrent /api requests per route class
+    (reads, writes, photo transfers, CSV exports).
+
+    A request waits at most ``queue_timeout`` seconds for a slot, and only if
+    fewer than ``queue_size`` requests are already waiting; otherwise it is
+    answered right away with 503 and Retry-After instead of piling onto the
+    database.
+    """
+
+    def __init__(
+        self,
+        app,
+        read_limit: int = ADMISSION_READ_LIMIT,
+        write_limit: int = ADMISSION_WRITE_LIMIT,
+        photo_limit: int = ADMISSION_PHOTO_LIMIT,
+        export_limit: int = ADMISSION_EXPORT_LIMIT,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        retry_after: int = ADMISSION_RETRY_AFTER,
+    ):
+        self.app = app
+        self.retry_after = retry_after
+        self.limiters = {
+            "reads": Limiter("reads", read_limit, queue_size, queue_timeout),
+            "writes": Limiter("writes", write_limit, queue_size, queue_timeout),
+            "photos": Limiter("photos", photo_limit, queue_size, queue_timeout),
+            "exports": Limiter("exports", export_limit, queue_size, queue_timeout),
+        }
+
+    def route_class(self, scope):
+        if scope["path"].startswith(PHOTO_PATHS):
+            return "photos"
+        if scope["path"].startswith(EXPORT_PATHS):
+            return "exports"
+        if scope["method"] in READ_METHODS:
+            return "reads"
+        return "writes"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters[self.route_class(scope)]
+        if not await limiter.acquire():
+            logger.warning("Shedding %s %s (%s: %s)", scope["method"], scope["path"], limiter.name, limiter.stats())
+            await self._reject(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": "Server is busy, please retry shortly."}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(self.retry_after).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
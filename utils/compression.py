@@ -0,0 +1,212 @@
+import os
+import zlib
+import importlib.util
+import logging
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Responses smaller than this are sent as-is: compressing them costs CPU and
+# usually saves fewer bytes than the extra headers add.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Photo endpoints return (base64 encoded) JPEG/PNG bytes, which do not shrink
+# enough to be worth the CPU.
+COMPRESSION_EXCLUDED_PATHS = tuple(
+    path.strip()
+    for path in os.getenv("COMPRESSION_EXCLUDED_PATHS", "/api/restaurant/photo").split(",")
+    if path.strip()
+)
+
+# Media types that are already compressed
+SKIPPED_CONTENT_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/pdf",
+    "application/octet-stream",
+)
+
+# Whether brotli can be imported, checked without importing it so requests
+# that never get compressed (small bodies, GET /) don't pay for the import
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+
+_brotli = None
+
+
+def _load_brotli():
+    """Import brotli the first time a body is actually brotli-compressed."""
+    global _brotli
+    if _brotli is None:
+        import brotli
+        _brotli = brotli
+    return _brotli
+
+
+def negotiate_encoding(accept_encoding: str):
+    """
+    Pick the best supported coding from an Accept-Encoding header.
+
+    Returns "br", "gzip" or None (send the body uncompressed).
+    """
+    supported = ["br", "gzip"] if BROTLI_AVAILABLE else ["gzip"]
+    best, best_q = None, 0.0
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        candidates = supported if coding == "*" else [coding]
+        for candidate in candidates:
+            if candidate not in supported or q <= 0:
+                continue
+            # On equal q prefer the coding listed first in `supported` (br)
+            if q > best_q or (q == best_q and supported.index(candidate) < supported.index(best)):
+                best, best_q = candidate, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        if encoding == "br":
+            self._brotli = _load_brotli().Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits=31 -> gzip container
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that gzip/brotli-compresses responses based on the
+    client's Accept-Encoding.
+
+    Bodies below ``minimum_size``, already-encoded responses, compressed media
+    types and ``excluded_paths`` are passed through untouched. Streaming
+    responses are compressed chunk by chunk so memory stays constant.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+        excluded_paths: tuple = COMPRESSION_EXCLUDED_PATHS,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.excluded_paths = excluded_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.excluded_paths):
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding, settings):
+        self._send = send
+        self.encoding = encoding
+        self.settings = settings
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    def _skip(self, headers):
+        if any(name == b"content-encoding" for name, _ in headers):
+            return True
+        for name, value in headers:
+            if name == b"content-type":
+                return value.decode("latin-1").lower().startswith(SKIPPED_CONTENT_TYPES)
+        return False
+
+    def _start_headers(self, headers, content_length=None):
+        headers = [(name, value) for name, value in headers if name != b"content-length"]
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        for index, (name, value) in enumerate(headers):
+            if name == b"vary":
+                if b"accept-encoding" not in value.lower():
+                    headers[index] = (name, value + b", Accept-Encoding")
+                break
+        else:
+            headers.append((b"vary", b"Accept-Encoding"))
+        return headers
+
+    async def send(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Hold the start message until we know the body size
+            self.start_message = message
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = list(self.start_message["headers"])
+            if self._skip(headers) or (not more_body and len(body) < self.settings.minimum_size):
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding, self.settings.gzip_level, self.settings.brotli_quality)
+            if not more_body:
+                compressed = self.compressor.compress(body) + self.compressor.finish()
+                self.start_message["headers"] = self._start_headers(headers, len(compressed))
+                await self._send(self.start_message)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+
+            # Streaming response: length is unknown, compress as chunks arrive
+            self.start_message["headers"] = self._start_headers(headers)
+            await self._send(self.start_message)
+
+        chunk = self.compressor.compress(body) if body else b""
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
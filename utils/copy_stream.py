@@ -0,0 +1,149 @@
+import csv
+import io
+import queue
+import weakref
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bytes buffered before a chunk is handed to the client; with the queue size
+# this bounds an export's memory regardless of how many rows it has.
+COPY_CHUNK_SIZE = 64 * 1024
+COPY_QUEUE_CHUNKS = 8
+
+_DONE = object()
+
+
+class _CopyPipe:
+    """File-like target for ``copy_expert`` feeding a bounded queue of chunks."""
+
+    def __init__(self):
+        self.queue = queue.Queue(COPY_QUEUE_CHUNKS)
+        self.cancelled = threading.Event()
+        self._buffer = []
+        self._size = 0
+
+    def _put(self, item):
+        # Give up when the consumer went away instead of blocking forever
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise IOError("Export cancelled by client")
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= COPY_CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._put(b"".join(self._buffer))
+            self._buffer, self._size = [], 0
+
+    def close(self, error=None):
+        if error is None:
+            self.flush()
+        try:
+            self._put(error if error is not None else _DONE)
+        except IOError:
+            pass
+
+
+def stream_copy_out(connection, copy_sql):
+    """
+    Run ``COPY ... TO STDOUT`` on ``connection`` in a background thread and
+    return an iterator over its output chunks.
+
+    Blocks until the first chunk is ready, so a COPY that fails to start is
+    raised here, before the caller has sent a response. The connection is
+    closed when the copy ends, fails or the consumer stops iterating (e.g.
+    the client disconnected).
+    """
+    pipe = _CopyPipe()
+
+    def produce():
+        cursor = connection.cursor()
+        try:
+            cursor.copy_expert(copy_sql, pipe)
+            pipe.close()
+        except Exception as error:
+            if not pipe.cancelled.is_set():
+                logger.error("Error streaming COPY output: %s", error)
+            pipe.close(error)
+        finally:
+            cursor.close()
+            connection.close()
+
+    threading.Thread(target=produce, name="copy-out", daemon=True).start()
+
+    first = pipe.queue.get()
+    if isinstance(first, Exception):
+        raise first
+    chunks = _chunks(pipe, first)
+    # A response that is never iterated must still release the copy thread
+    weakref.finalize(chunks, pipe.cancelled.set)
+    return chunks
+
+
+def _chunks(pipe, item):
+    try:
+        while item is not _DONE:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            item = pipe.queue.get()
+    finally:
+        pipe.cancelled.set()
+
+
+class CsvRowReader:
+    """
+    File-like source for ``COPY ... FROM STDIN`` that serializes rows lazily.
+
+    ``rows`` is any iterable of sequences; only one row is held at a time.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ""
+        self._line = io.StringIO()
+        self._writer = csv.writer(self._line, lineterminator="\n")
+
+    def _next_line(self):
+        row = next(self._rows, None)
+        if row is None:
+            return ""
+        self._line.seek(0)
+        self._line.truncate()
+        self._writer.writerow(row)
+        return self._line.getvalue()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = self._next_line()
+            if not line:
+                break
+            self._buffer += line
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        if not self._buffer:
+            self._buffer = self._next_line()
+        index = self._buffer.find("\n")
+        end = len(self._buffer) if index < 0 else index + 1
+        if 0 <= size < end:
+            end = size
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
@@ -1,44 +1,252 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import re
+import time
+import logging
+import threading
+from http.cookies import SimpleCookie
+from contextvars import ContextVar
+from itertools import count
 from dotenv import load_dotenv
 import psycopg2
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
 DB_HOST = os.getenv("HOST")
 DB_PORT = os.getenv("PORT")
 DB_NAME = os.getenv("DATABASE")
-DB_USER = os.getenv("USER")
 DB_PASSWORD = os.getenv("PASSWORD")
 
-print(f"Connecting to database with the following settings:")
-print(f"Host: {DB_HOST}")
-print(f"Database: {DB_NAME}")
-print(f"User: {DB_USER}")
-print(f"Password: {DB_PASSWORD}")  # Be careful: this should not be printed in production
-
-
-def get_db():
-    if not DB_USER == "developuser":
-        connection = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user="developuser",
-            password=DB_PASSWORD,
-            port=DB_PORT
-    )
-    else:
-        connection = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
+# Connection settings are only logged when a connection is actually opened,
+# never at import time (and never the password).
+
+# Read replicas as a comma separated list of host[:port]; same database,
+# user and password as the primary. Empty -> everything goes to the primary.
+DB_REPLICAS = [
+    replica.strip()
+    for replica in os.getenv("REPLICA_HOSTS", "").split(",")
+    if replica.strip()
+]
+# A replica further behind than this is skipped until REPLICA_RETRY_SECONDS pass
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+# How long a replica's measured lag is trusted before it is checked again
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "5"))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", "2"))
+# How long a client keeps sending the write token of its last write (cookie
+# Max-Age); past REPLICA_MAX_LAG_SECONDS every usable replica has replayed it
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+# The write token is the primary's WAL position (pg_lsn, e.g. "16/B374D848")
+# after the client's last write, returned in this header and cookie and sent
+# back by the client on its next requests
+WRITE_TOKEN_HEADER = "X-Last-Write"
+WRITE_TOKEN_COOKIE = "last_write"
+_WRITE_TOKEN = re.compile(r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+
+# Seconds of replay lag; 0 when the replica has replayed everything it
+# received, NULL when it is not streaming from the primary (it may have
+# replayed all it has and still be arbitrarily far behind). The status column
+# needs the pg_read_all_stats role; without it the replica counts as lagging.
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# True when the replica has replayed the WAL up to the client's write token
+REPLICA_CAUGHT_UP_QUERY = "SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)"
+
+# Per-process routing state, guarded by _lock
+_lock = threading.Lock()
+_replica_down_until = {}
+_replica_lag_checked_at = {}
+_round_robin = count()
+
+# (token sent by the client, tokens of writes made by this request); set per
+# request by ReadYourWritesMiddleware
+_write_tokens = ContextVar("write_tokens", default=(None, None))
+
+
+def _connect(host, port, **kwargs):
+    logger.debug("Connecting to database %s on %s", DB_NAME, host)
+    return psycopg2.connect(
+        host=host,
+        database=DB_NAME,
+        # Always the application role: USER is the OS login name in most
+        # shells, so os.getenv("USER") names whoever started the server
+        user="developuser",
+        password=DB_PASSWORD,
+        port=port,
+        **kwargs
     )
+
+
+def mark_write(connection):
+    """
+    Call after committing a write on ``connection`` (the primary): the
+    response carries the primary's WAL position so the client's next reads
+    only go to replicas that have replayed it.
+    """
+    _, written = _write_tokens.get()
+    if written is None:
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT pg_current_wal_lsn()::text")
+        written.append(cursor.fetchone()[0])
+        connection.commit()
+    except psycopg2.Error as error:
+        # Without a token the client may briefly read its write from a lagging replica
+        logger.warning("Could not read the primary WAL position: %s", error)
+        connection.rollback()
+    finally:
+        cursor.close()
+
+
+def read_after():
+    """The write token this request's reads must observe, or None."""
+    return _write_tokens.get()[0]
+
+
+def _mark_replica_down(replica, now, reason):
+    logger.warning("Skipping read replica %s for %ss: %s", replica, REPLICA_RETRY_SECONDS, reason)
+    with _lock:
+        _replica_down_until[replica] = now + REPLICA_RETRY_SECONDS
+        _replica_lag_checked_at.pop(replica, None)
+
+
+def _replica_connection(now, token=None):
+    """Connect to the next healthy replica that has replayed ``token``, or return None."""
+    with _lock:
+        start = next(_round_robin)
+        candidates = [
+            DB_REPLICAS[(start + offset) % len(DB_REPLICAS)]
+            for offset in range(len(DB_REPLICAS))
+        ]
+        candidates = [r for r in candidates if _replica_down_until.get(r, 0) <= now]
+
+    for replica in candidates:
+        host, _, port = replica.partition(":")
+        try:
+            connection = _connect(host, port or DB_PORT, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+        except psycopg2.Error as error:
+            _mark_replica_down(replica, now, error)
+            continue
+
+        with _lock:
+            checked_at = _replica_lag_checked_at.get(replica)
+        check_lag = checked_at is None or now - checked_at >= REPLICA_LAG_CHECK_SECONDS
+        lag = None
+        caught_up = True
+        try:
+            cursor = connection.cursor()
+            if check_lag:
+                cursor.execute(REPLICA_LAG_QUERY)
+                lag = cursor.fetchone()[0]
+            if token is not None:
+                cursor.execute(REPLICA_CAUGHT_UP_QUERY, (token,))
+                caught_up = cursor.fetchone()[0]
+            cursor.close()
+            connection.rollback()
+        except psycopg2.Error as error:
+            connection.close()
+            _mark_replica_down(replica, now, error)
+            continue
+
+        if check_lag:
+            if lag is None:
+                connection.close()
+                _mark_replica_down(replica, now, "not streaming from the primary")
+                continue
+            if lag > REPLICA_MAX_LAG_SECONDS:
+                connection.close()
+                _mark_replica_down(replica, now, f"lagging {lag:.1f}s")
+                continue
+            with _lock:
+                _replica_lag_checked_at[replica] = now
+
+        if not caught_up:
+            # Healthy, just behind this client's write; another replica may not be
+            connection.close()
+            continue
+        return connection
+    return None
+
+
+def get_connection(read_only=False):
+    """
+    Open a connection for one request.
+
+    Writes (the default) always use the primary. ``read_only=True`` routes to a
+    read replica when one is configured, healthy, not lagging and has replayed
+    the client's last write (see ``mark_write``); otherwise it falls back to
+    the primary.
+    """
+    if read_only and DB_REPLICAS:
+        connection = _replica_connection(time.monotonic(), read_after())
+        if connection is not None:
+            return connection
+    return _connect(DB_HOST, DB_PORT)
+
+
+def get_read_db():
+    connection = get_connection(read_only=True)
     cursor = connection.cursor()
     try:
         yield cursor
     finally:
         cursor.close()
-        connection.close()
\ No newline at end of file
+        connection.close()
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI middleware that carries the write token between requests: the token
+    the client sends (WRITE_TOKEN_HEADER or WRITE_TOKEN_COOKIE) is exposed to
+    ``get_connection``, and a write made by the request (``mark_write``) is
+    returned in both the header and the cookie. The state lives with the
+    client, so it holds across workers and servers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = None
+        for name, value in scope["headers"]:
+            if name == WRITE_TOKEN_HEADER.lower().encode("latin-1"):
+                token = value.decode("latin-1").strip()
+                break
+            if name == b"cookie" and token is None:
+                morsel = SimpleCookie(value.decode("latin-1")).get(WRITE_TOKEN_COOKIE)
+                token = morsel.value if morsel is not None else None
+        if token is not None and not _WRITE_TOKEN.match(token):
+            token = None
+        written = []
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start" and written:
+                cookie = (
+                    f"{WRITE_TOKEN_COOKIE}={written[-1]}; Max-Age={int(READ_YOUR_WRITES_SECONDS)}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = list(message.get("headers", [])) + [
+                    (WRITE_TOKEN_HEADER.lower().encode("latin-1"), written[-1].encode("latin-1")),
+                    (b"set-cookie", cookie.encode("latin-1")),
+                ]
+            await send(message)
+
+        context = _write_tokens.set((token, written))
+        try:
+            await self.app(scope, receive, send_with_token)
+        finally:
+            _write_tokens.reset(context)
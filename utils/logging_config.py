@@ -0,0 +1,169 @@
+"""
+Application logging: configured once from main.py via ``configure_logging``.
+
+Records are put on an in-memory queue by the request thread and written by a
+background QueueListener thread, so request handlers never wait on stderr.
+Each record is written as one JSON object carrying the current request id
+(see ``RequestIdMiddleware``). Chatty levels can be sampled:
+
+    LOG_LEVEL=DEBUG
+    LOG_SAMPLE_RATES=DEBUG=0.05,INFO=1
+    LOG_QUEUE_SIZE=10000
+"""
+import os
+import copy
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of records kept per level; levels not listed are always kept
+LOG_SAMPLE_RATES = {
+    level.strip().upper(): float(rate)
+    for level, _, rate in (
+        part.partition("=") for part in os.getenv("LOG_SAMPLE_RATES", "DEBUG=0.1").split(",") if "=" in part
+    )
+}
+# When the writer thread falls behind, new records are dropped rather than
+# blocking the request
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Loggers uvicorn configures with their own stream handlers and
+# propagate=False; configure_logging sends them through the queue instead
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+request_id_var = ContextVar("request_id", default=None)
+
+_listener = None
+
+
+class _RequestContextFilter(logging.Filter):
+    """Attach the current request id; runs in the thread that logs, not the writer."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {logging.getLevelName(level): rate for level, rate in rates.items()}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        return rate is None or rate >= 1 or random.random() < rate
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args now (they may change after the call returns) but leave
+        # the JSON formatting to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Route all logging, uvicorn's included, through a queue to a background JSON writer. Idempotent."""
+    global _listener
+    if _listener is not None:
+        return
+
+    writer = logging.StreamHandler()
+    writer.setFormatter(JsonFormatter())
+
+    handler = _NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(_SamplingFilter(LOG_SAMPLE_RATES))
+    handler.addFilter(_RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    # uvicorn sets these up before it imports the app, so this runs after it
+    for name in SERVER_LOGGERS:
+        server_logger = logging.getLogger(name)
+        for existing in list(server_logger.handlers):
+            server_logger.removeHandler(existing)
+        server_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(handler.queue, writer)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that tags every request with an id (the incoming
+    X-Request-ID header, or a new one), exposes it to log records and echoes
+    it back in the response's X-Request-ID header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,200 @@
+"""
+In-memory index behind GET /foodnames/search.
+
+A restaurant's menu is a few thousand dishes at most and changes rarely, so
+each worker keeps one MenuSearchIndex per restaurant and answers lookups
+without a database round trip. An index is rebuilt from menu_table after
+MENU_SEARCH_TTL_SECONDS, or right away after a menu import in this worker
+(``invalidate``); other workers see imported dishes within the TTL.
+"""
+import heapq
+import logging
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import chain
+
+from utils.db_authenticate import get_connection
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MAX_RESULTS = 50
+# Share of the query's trigrams a dish name or category must contain; 0.5
+# still matches one-letter typos such as "chiken" -> "Chicken"
+SEARCH_SIMILARITY_THRESHOLD = 0.5
+MENU_SEARCH_TTL_SECONDS = float(os.getenv("MENU_SEARCH_TTL_SECONDS", "60"))
+
+MENU_SEARCH_ITEMS_QUERY = "SELECT food_name, category FROM menu_table WHERE restaurant_id = %s"
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def trigrams(text):
+    """Trigrams as pg_trgm makes them: lower case words padded with two spaces in front and one behind."""
+    found = set()
+    for word in _WORD.findall(text.lower()):
+        padded = f"  {word} "
+        found.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return found
+
+
+def _rank(result):
+    prefix_match, score, food_name, _ = result
+    return (not prefix_match, -score, food_name)
+
+
+def _bitmap(positions, size):
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+class MenuSearchIndex:
+    """
+    Prefix and trigram index over one restaurant's (food_name, category) rows.
+
+    ``search`` returns (prefix_match, score, food_name, category) tuples, best
+    first: dishes whose name starts with the term, then the rest whose name or
+    category contains at least SEARCH_SIMILARITY_THRESHOLD of the term's
+    trigrams, each group by score (that share) and name.
+
+    Dishes are numbered in name order and every trigram and category maps to
+    a bitmap (an int) of the dishes containing it, so a lookup is a few dozen
+    operations on ints of one bit per dish whatever the number of matches,
+    and the best names of a score are its lowest set bits.
+    """
+
+    def __init__(self, items):
+        items = sorted(items, key=lambda item: (item[0].lower(), item[0]))
+        self._names = [food_name for food_name, _ in items]
+        self._categories = [category for _, category in items]
+        self._lower_names = [food_name.lower() for food_name in self._names]
+        self._all = (1 << len(items)) - 1
+        postings = defaultdict(list)
+        members = defaultdict(list)
+        for position, (food_name, category) in enumerate(items):
+            for trigram in trigrams(food_name):
+                postings[trigram].append(position)
+            members[category].append(position)
+        self._postings = {trigram: _bitmap(positions, len(items)) for trigram, positions in postings.items()}
+        self._category_bitmaps = [
+            (trigrams(category or ""), _bitmap(positions, len(items))) for category, positions in members.items()
+        ]
+
+    def __len__(self):
+        return len(self._names)
+
+    def _take(self, bitmap, limit, prefix_match, score, results):
+        while bitmap and len(results) < limit:
+            lowest = bitmap & -bitmap
+            position = lowest.bit_length() - 1
+            results.append((prefix_match, score, self._names[position], self._categories[position]))
+            bitmap ^= lowest
+
+    def search(self, term, limit):
+        wanted = trigrams(term)
+        size = len(wanted) or 1
+
+        # Bit-sliced counter: bit i of a dish's count of shared trigrams is
+        # its bit in counter[i]
+        counter = []
+        for trigram in wanted:
+            carry = self._postings.get(trigram, 0)
+            for i, counted in enumerate(counter):
+                if not carry:
+                    break
+                counter[i], carry = counted ^ carry, counted & carry
+            if carry:
+                counter.append(carry)
+
+        def sharing(count):
+            if count >> len(counter):
+                return 0
+            bitmap = self._all
+            for i, counted in enumerate(counter):
+                bitmap &= counted if count >> i & 1 else ~counted
+            return bitmap
+
+        # Dishes by score: the share of trigrams in the name, or in the
+        # category when that is a match and higher
+        levels = defaultdict(int)
+        for count in range(size + 1):
+            levels[count / size] |= sharing(count)
+        for category_trigrams, bitmap in self._category_bitmaps:
+            score = len(wanted & category_trigrams) / size
+            if score >= SEARCH_SIMILARITY_THRESHOLD:
+                levels[score] |= bitmap
+
+        key = term.lower()
+        start = bisect_left(self._lower_names, key)
+        end = start
+        while end < len(self._lower_names) and self._lower_names[end].startswith(key):
+            end += 1
+        prefixed = ((1 << end) - 1) ^ ((1 << start) - 1)
+
+        results = []
+        for prefix_match, candidates, floor in ((True, prefixed, 0), (False, self._all ^ prefixed, SEARCH_SIMILARITY_THRESHOLD)):
+            for score in sorted(levels, reverse=True):
+                if score < floor or len(results) >= limit:
+                    break
+                self._take(levels[score] & candidates, limit, prefix_match, score, results)
+                candidates &= ~levels[score]
+        return results
+
+
+# restaurant_id -> (expires_at, MenuSearchIndex); restaurant_id -> generation,
+# bumped by invalidate() so a build that raced an import is not kept
+_indexes = {}
+_generations = Counter()
+# Concurrent searches of a restaurant whose index is missing share one build
+index_flight = SingleFlight("/foodnames/search")
+
+
+def _build(restaurant_id):
+    # From the primary: an index built from a lagging replica would be served
+    # for the whole TTL
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(MENU_SEARCH_ITEMS_QUERY, (restaurant_id,))
+        index = MenuSearchIndex(cursor.fetchall())
+    finally:
+        cursor.close()
+        connection.close()
+    logger.debug("Built the search index of restaurant %s (%s items)", restaurant_id, len(index))
+    return index
+
+
+def restaurant_index(restaurant_id):
+    """The restaurant's MenuSearchIndex, built from menu_table if missing or expired."""
+    now = time.monotonic()
+    cached = _indexes.get(restaurant_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    generation = _generations[restaurant_id]
+    index = index_flight.do(restaurant_id, lambda: _build(restaurant_id))
+    if _generations[restaurant_id] == generation:
+        for expired in [key for key, (expires_at, _) in _indexes.items() if expires_at <= now]:
+            _indexes.pop(expired, None)
+        _indexes[restaurant_id] = (now + MENU_SEARCH_TTL_SECONDS, index)
+    return index
+
+
+def invalidate(restaurant_id):
+    """Call after committing menu rows added or renamed for ``restaurant_id``."""
+    _generations[restaurant_id] += 1
+    _indexes.pop(restaurant_id, None)
+
+
+def search(restaurant_ids, term, limit):
+    """Best ``limit`` matches for ``term`` across the restaurants' menus (see MenuSearchIndex)."""
+    return heapq.nsmallest(
+        limit,
+        chain.from_iterable(restaurant_index(restaurant_id).search(term, limit) for restaurant_id in restaurant_ids),
+        key=_rank,
+    )
@@ -0,0 +1,454 @@
+"""
+Versioned schema migrations.
+
+Each migration runs once and is recorded in ``schema_migrations``. Applied
+migrations must never be edited; add a new one instead.
+
+    python -m utils.migrations status
+    python -m utils.migrations upgrade
+    python -m utils.migrations explain --manager-id 1 --category Drinks --food-name "Pad Thai"
+    python -m utils.migrations explain --seed
+
+``explain`` runs EXPLAIN for the hot endpoint queries and fails if a query is
+not planned with the index it relies on. The planner only picks an index
+over a sequential scan once a table holds enough rows, so on a small
+database run it with ``--seed``: throwaway restaurants with realistic order
+and menu volume are inserted and analyzed first, in a transaction that is
+rolled back afterwards. Point it at a test database, not production.
+"""
+import argparse
+import json
+import logging
+import re
+import sys
+from typing import NamedTuple
+
+from utils.order_queries import (
+    ACTIVE_ORDER_STATUSES,
+    ACTIVE_ORDERS_QUERY,
+    CHANGED_ORDERS_QUERY,
+    ORDER_CURSOR_QUERY,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: tuple
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    transactional: bool = True
+
+
+MIGRATIONS = (
+    Migration(1, "sales_rollups", (
+        "ALTER TABLE order_table ADD COLUMN IF NOT EXISTS closed_at timestamptz",
+        """
+        CREATE TABLE IF NOT EXISTS sales_hourly_rollup (
+            restaurant_id integer NOT NULL,
+            bucket timestamptz NOT NULL,
+            status text NOT NULL,
+            order_count integer NOT NULL DEFAULT 0,
+            revenue numeric NOT NULL DEFAULT 0,
+            PRIMARY KEY (restaurant_id, bucket, status)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sales_dish_rollup (
+            restaurant_id integer NOT NULL,
+            day date NOT NULL,
+            status text NOT NULL,
+            food_name text NOT NULL,
+            quantity integer NOT NULL DEFAULT 0,
+            order_count integer NOT NULL DEFAULT 0,
+            revenue numeric NOT NULL DEFAULT 0,
+            PRIMARY KEY (restaurant_id, day, status, food_name)
+        )
+        """,
+    )),
+    Migration(2, "hot_path_indexes", (
+        # /menus, /menus/food, /foodnames, menu availability updates
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS menu_table_restaurant_category_idx "
+        "ON menu_table (restaurant_id, category)",
+        # /order, /history and other status filtered order scans
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS order_table_restaurant_status_number_idx "
+        "ON order_table (restaurant_id, status, order_number)",
+        # manager -> restaurant subquery used by every authenticated endpoint
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS manager_account_table_manager_id_idx "
+        "ON manager_account_table (manager_id) INCLUDE (restaurant_id)",
+        # /login
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS manager_account_table_name_idx "
+        "ON manager_account_table (manager_account_name)",
+        # photo lookups and upload upserts
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS restaurant_photos_restaurant_food_idx "
+        "ON restaurant_photos (restaurant_id, food_name)",
+    ), transactional=False),
+    Migration(3, "order_change_tracking", (
+        # change_seq orders inserts and status changes for /order?since=
+        "CREATE SEQUENCE IF NOT EXISTS order_change_seq",
+        "ALTER TABLE order_table ADD COLUMN IF NOT EXISTS change_seq bigint",
+        "ALTER TABLE order_table ADD COLUMN IF NOT EXISTS changed_at timestamptz",
+        # changed_at uses clock_timestamp(), not now(): now() is the
+        # transaction start, and a change that commits late must not look
+        # older than it is to the /order?since= grace window
+        "UPDATE order_table SET change_seq = nextval('order_change_seq'), changed_at = clock_timestamp() "
+        "WHERE change_seq IS NULL",
+        "ALTER TABLE order_table ALTER COLUMN change_seq SET DEFAULT nextval('order_change_seq')",
+        "ALTER TABLE order_table ALTER COLUMN changed_at SET DEFAULT clock_timestamp()",
+    )),
+    Migration(4, "order_change_indexes", (
+        # /order?since= and the newest change_seq of the cursor
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS order_table_restaurant_change_seq_idx "
+        "ON order_table (restaurant_id, change_seq)",
+        # /order cursor: only the changes inside the grace window
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS order_table_restaurant_changed_at_idx "
+        "ON order_table (restaurant_id, changed_at) INCLUDE (change_seq)",
+    ), transactional=False),
+)
+
+# (description, query, indexes the plan must use[, query parameters fixed by the check])
+EXPLAIN_CHECKS = (
+    (
+        "GET /menus/food",
+        """
+        SELECT food_name, food_price, availability
+        FROM menu_table
+        WHERE restaurant_id IN (
+            SELECT restaurant_id FROM manager_account_table WHERE manager_id = %(manager_id)s
+        ) AND category = %(category)s
+        """,
+        ("manager_account_table_manager_id_idx", "menu_table_restaurant_category_idx"),
+    ),
+    (
+        "GET /order",
+        ACTIVE_ORDERS_QUERY,
+        ("manager_account_table_manager_id_idx", "order_table_restaurant_status_number_idx"),
+        {"active_statuses": ACTIVE_ORDER_STATUSES},
+    ),
+    (
+        "GET /history",
+        """
+        SELECT ot.order_number
+        FROM order_table ot
+        WHERE ot.restaurant_id IN (
+            SELECT restaurant_id FROM manager_account_table WHERE manager_id = %(manager_id)s
+        )
+        AND ot.status IN ('complete', 'cancelled')
+        ORDER BY ot.order_number
+        """,
+        ("manager_account_table_manager_id_idx", "order_table_restaurant_status_number_idx"),
+    ),
+    (
+        "GET /order?since=",
+        CHANGED_ORDERS_QUERY,
+        ("manager_account_table_manager_id_idx", "order_table_restaurant_change_seq_idx"),
+    ),
+    (
+        "GET /order cursor",
+        ORDER_CURSOR_QUERY,
+        (
+            "manager_account_table_manager_id_idx",
+            "order_table_restaurant_change_seq_idx",
+            "order_table_restaurant_changed_at_idx",
+        ),
+        {"grace_seconds": 2},
+    ),
+    (
+        "POST /login",
+        """
+        SELECT manager_account_password, manager_id
+        FROM manager_account_table
+        WHERE manager_account_name = %(username)s
+        """,
+        ("manager_account_table_name_idx",),
+    ),
+    (
+        "GET /restaurant/photo",
+        """
+        SELECT photo_id
+        FROM restaurant_photos
+        WHERE restaurant_id = %(manager_id)s AND food_name = %(food_name)s
+        """,
+        ("restaurant_photos_restaurant_food_idx",),
+    ),
+)
+
+
+def ensure_migrations_table(connection):
+    cursor = connection.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version integer PRIMARY KEY,
+            name text NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+        """
+    )
+    connection.commit()
+    cursor.close()
+
+
+def applied_versions(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cursor.fetchall()}
+    connection.commit()
+    cursor.close()
+    return versions
+
+
+CREATED_INDEX = re.compile(r"CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)", re.IGNORECASE)
+
+
+def _invalid_indexes(cursor, names):
+    """Names among ``names`` left INVALID by a failed CREATE INDEX CONCURRENTLY."""
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY(%s) AND NOT i.indisvalid
+        """,
+        (list(names),),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def upgrade(connection):
+    """Apply all pending migrations in version order; returns the versions applied."""
+    ensure_migrations_table(connection)
+    done = applied_versions(connection)
+    applied = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version in done:
+            continue
+        logger.info("Applying migration %s_%s", migration.version, migration.name)
+        connection.autocommit = not migration.transactional
+        cursor = connection.cursor()
+        try:
+            indexes = [
+                match.group(1)
+                for statement in migration.statements
+                for match in CREATED_INDEX.finditer(statement)
+            ]
+            # A failed concurrent build leaves an INVALID index that IF NOT
+            # EXISTS would keep; drop it so it is rebuilt
+            for index in _invalid_indexes(cursor, indexes) if indexes else []:
+                logger.warning("Dropping invalid index %s before rebuilding it", index)
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+            for statement in migration.statements:
+                cursor.execute(statement)
+            invalid = _invalid_indexes(cursor, indexes) if indexes else []
+            if invalid:
+                raise RuntimeError(
+                    f"Migration {migration.version}_{migration.name} left invalid indexes: {', '.join(invalid)}"
+                )
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (migration.version, migration.name),
+            )
+            if migration.transactional:
+                connection.commit()
+        except Exception:
+            if migration.transactional:
+                connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            connection.autocommit = False
+        applied.append(migration.version)
+    return applied
+
+
+def _plan_indexes(plan):
+    """Collect every index name referenced anywhere in an EXPLAIN (FORMAT JSON) plan."""
+    found = set()
+    if isinstance(plan, dict):
+        if "Index Name" in plan:
+            found.add(plan["Index Name"])
+        for value in plan.values():
+            found |= _plan_indexes(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            found |= _plan_indexes(value)
+    return found
+
+
+def seed(cursor, restaurants=1000, busy_restaurants=20, orders=5000, menu_items=1000):
+    """
+    Insert ``restaurants`` throwaway restaurants with their managers and a few
+    photos each, the first ``busy_restaurants`` of them also with ``orders``
+    orders and ``menu_items`` dishes, and analyze the tables so explain() sees
+    production like row counts. Nothing is committed: run it in the
+    transaction explain() rolls back. Returns explain() parameters for the
+    first restaurant.
+    """
+    cursor.execute(
+        "SELECT COALESCE(MAX(restaurant_id), 0), COALESCE(MAX(manager_id), 0) FROM manager_account_table"
+    )
+    restaurant_base, manager_base = cursor.fetchone()
+    counts = {
+        "restaurant_base": restaurant_base,
+        "manager_base": manager_base,
+        "restaurants": restaurants,
+        "busy": busy_restaurants,
+        "orders": orders,
+        "items": menu_items,
+    }
+    cursor.execute(
+        """
+        INSERT INTO manager_account_table (manager_account_name, manager_account_password, restaurant_id, manager_id)
+        SELECT 'explain-' || (%(manager_base)s + r), '', %(restaurant_base)s + r, %(manager_base)s + r
+        FROM generate_series(1, %(restaurants)s) r
+        """,
+        counts,
+    )
+    # Months of closed orders per restaurant, the last few still active
+    cursor.execute(
+        """
+        INSERT INTO order_table (order_number, restaurant_id, status, fooditems, closed_at, changed_at)
+        SELECT
+            900000000::bigint + (%(restaurant_base)s + r) * %(orders)s + o,
+            %(restaurant_base)s + r,
+            status,
+            jsonb_build_array(jsonb_build_object('food_name', 'Dish ' || o %% 50, 'unit_price', 9.5)),
+            CASE WHEN status IN ('complete', 'cancelled') THEN placed_at END,
+            placed_at
+        FROM generate_series(1, %(busy)s) r
+        CROSS JOIN generate_series(1, %(orders)s) o
+        CROSS JOIN LATERAL (
+            SELECT
+                CASE WHEN o > %(orders)s - 20 THEN (ARRAY['new', 'prepare'])[1 + o %% 2]
+                     WHEN o %% 10 = 0 THEN 'cancelled' ELSE 'complete' END AS status,
+                now() - make_interval(mins => %(orders)s - o) * 30 AS placed_at
+        ) placed
+        """,
+        counts,
+    )
+    cursor.execute(
+        """
+        INSERT INTO menu_table (restaurant_id, category, food_name, food_price, availability)
+        SELECT
+            %(restaurant_base)s + r,
+            (ARRAY['Mains', 'Noodles', 'Rice', 'Soups', 'Starters', 'Salads', 'Desserts', 'Drinks'])[1 + i %% 8],
+            (ARRAY['Spicy', 'Crispy', 'Grilled', 'Garlic', 'Smoked', 'Honey', 'Lemon', 'Sesame'])[1 + i %% 8] || ' '
+            || (ARRAY['Chicken', 'Beef', 'Pork', 'Tofu', 'Shrimp', 'Salmon', 'Duck', 'Lamb', 'Mushroom', 'Eggplant'])[1 + i / 8 %% 10] || ' '
+            || (ARRAY['Teriyaki Bowl', 'Fried Rice', 'Noodle Soup', 'Curry', 'Bao', 'Skewers', 'Wrap', 'Dumplings'])[1 + i / 80 %% 8]
+            || ' #' || i,
+            9.5,
+            'available'
+        FROM generate_series(1, %(busy)s) r
+        CROSS JOIN generate_series(1, %(items)s) i
+        """,
+        counts,
+    )
+    cursor.execute(
+        """
+        INSERT INTO restaurant_photos (restaurant_id, food_name, description, photo_data, file_name, content_type)
+        SELECT %(restaurant_base)s + r, 'Dish #' || i, '', '\\x00', 'photo.jpg', 'image/jpeg'
+        FROM generate_series(1, %(restaurants)s) r
+        CROSS JOIN generate_series(1, 10) i
+        """,
+        counts,
+    )
+    for table in ("manager_account_table", "order_table", "menu_table", "restaurant_photos"):
+        cursor.execute(f"ANALYZE {table}")
+    return {
+        "manager_id": manager_base + 1,
+        "since": _recent_change_seq(cursor, [restaurant_base + 1]),
+        "category": "Drinks",
+        "food_name": "Dish #1",
+        "username": f"explain-{manager_base + 1}",
+    }
+
+
+def _recent_change_seq(cursor, restaurant_ids):
+    """A /order?since= cursor a polling client would send: a few changes behind."""
+    cursor.execute(
+        "SELECT COALESCE(MAX(change_seq), 0) - 10 FROM order_table WHERE restaurant_id = ANY(%s)",
+        (restaurant_ids,),
+    )
+    return cursor.fetchone()[0]
+
+
+def explain(connection, params):
+    """Run EXPLAIN_CHECKS; returns a list of (description, missing indexes)."""
+    failures = []
+    cursor = connection.cursor()
+    try:
+        for description, query, expected, *fixed in EXPLAIN_CHECKS:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, dict(params, **(fixed[0] if fixed else {})))
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            missing = [index for index in expected if index not in _plan_indexes(plan)]
+            if missing:
+                failures.append((description, missing))
+    finally:
+        connection.rollback()
+        cursor.close()
+    return failures
+
+
+def main():
+    from utils.db_authenticate import get_connection
+
+    parser = argparse.ArgumentParser(description="Apply and inspect schema migrations.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="list migrations and whether they are applied")
+    subparsers.add_parser("upgrade", help="apply pending migrations")
+    explain_parser = subparsers.add_parser("explain", help="check the hot queries use their indexes")
+    explain_parser.add_argument("--manager-id", type=int, default=1)
+    explain_parser.add_argument("--category", default="Main")
+    explain_parser.add_argument("--food-name", default="")
+    explain_parser.add_argument("--username", default="")
+    explain_parser.add_argument(
+        "--seed", action="store_true",
+        help="check against seeded throwaway restaurants (rolled back) instead of --manager-id",
+    )
+    args = parser.parse_args()
+
+    connection = get_connection()
+    try:
+        if args.command == "status":
+            ensure_migrations_table(connection)
+            done = applied_versions(connection)
+            for migration in MIGRATIONS:
+                state = "applied" if migration.version in done else "pending"
+                print(f"{migration.version:>4} {migration.name:<30} {state}")
+        elif args.command == "upgrade":
+            applied = upgrade(connection)
+            print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+        else:
+            cursor = connection.cursor()
+            if args.seed:
+                params = seed(cursor)
+            else:
+                cursor.execute(
+                    "SELECT restaurant_id FROM manager_account_table WHERE manager_id = %s", (args.manager_id,)
+                )
+                restaurant_ids = [row[0] for row in cursor.fetchall()]
+                params = {
+                    "manager_id": args.manager_id,
+                    "since": _recent_change_seq(cursor, restaurant_ids),
+                    "category": args.category,
+                    "food_name": args.food_name,
+                    "username": args.username,
+                }
+            cursor.close()
+            failures = explain(connection, params)
+            for description, missing in failures:
+                print(f"FAIL {description}: plan does not use {', '.join(missing)}", file=sys.stderr)
+            if failures:
+                return 1
+            print(f"All {len(EXPLAIN_CHECKS)} queries use their indexes.")
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
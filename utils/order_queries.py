@@ -0,0 +1,54 @@
+"""
+SQL behind GET /order, shared with the EXPLAIN checks in utils.migrations so
+the plans checked there are the plans the endpoint runs.
+"""
+
+ACTIVE_ORDER_STATUSES = ("new", "prepare")
+
+# Orders of the manager's restaurants with their food items; {condition}
+# selects which ones
+_ORDERS = """
+    SELECT
+        ot.*,
+        json_agg(json_build_object(
+            'food_name', elem ->> 'food_name',
+            'unit_price', (elem ->> 'unit_price')::numeric
+        )) AS fooditems
+    FROM order_table ot
+    LEFT JOIN LATERAL jsonb_array_elements(ot.fooditems) AS elem ON true
+    WHERE ot.restaurant_id IN (
+        SELECT restaurant_id
+        FROM manager_account_table
+        WHERE manager_id = %(manager_id)s
+    )
+    AND {condition}
+    GROUP BY ot.order_number
+    ORDER BY ot.order_number
+"""
+
+# GET /order: the active set, from the (restaurant_id, status, order_number) index
+ACTIVE_ORDERS_QUERY = _ORDERS.format(condition="ot.status IN %(active_statuses)s")
+
+# GET /order?since=: every order inserted or changed after the cursor
+CHANGED_ORDERS_QUERY = _ORDERS.format(condition="ot.change_seq > %(since)s")
+
+# Cursor returned with both. Per restaurant, the newest change_seq is one
+# probe of the change_seq index and the changes still inside the grace window
+# one short range scan of the changed_at index.
+ORDER_CURSOR_QUERY = """
+    SELECT GREATEST(MAX(latest.change_seq), %(since)s), MIN(settling.change_seq)
+    FROM manager_account_table ma
+    CROSS JOIN LATERAL (
+        SELECT MAX(change_seq) AS change_seq
+        FROM order_table
+        WHERE restaurant_id = ma.restaurant_id
+    ) latest
+    CROSS JOIN LATERAL (
+        SELECT MIN(change_seq) AS change_seq
+        FROM order_table
+        WHERE restaurant_id = ma.restaurant_id
+        AND changed_at > statement_timestamp() - make_interval(secs => %(grace_seconds)s)
+        AND change_seq > %(since)s
+    ) settling
+    WHERE ma.manager_id = %(manager_id)s
+"""
@@ -0,0 +1,158 @@
+"""
+Pre-aggregated sales rollups.
+
+Orders are folded into two rollup tables when they reach a closed status
+('complete' / 'cancelled'), so reports read a bounded number of rows per day
+instead of scanning the whole order history:
+
+* sales_hourly_rollup: orders and revenue per restaurant, hour and status
+* sales_dish_rollup:   quantity, revenue and orders per restaurant, day, status and dish
+
+Hours and days are those of REPORT_TIME_ZONE, not of the database session
+or the app server. ``update_order_status`` keeps the tables current through
+``apply_order``. They are created by migration 1 in utils/migrations.py and
+existing history is loaded (or, after changing REPORT_TIME_ZONE, rebucketed)
+with the backfill command:
+
+    python -m utils.rollups backfill [--timestamp-column closed_at]
+"""
+import argparse
+import logging
+import os
+import sys
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ("complete", "cancelled")
+# IANA name of the restaurants' local time zone, e.g. "Europe/Berlin"
+REPORT_TIME_ZONE = os.getenv("REPORT_TIME_ZONE", "UTC")
+
+# One row per food item of the order(s) selected by {where}; quantity
+# defaults to 1 for items stored without one.
+_ORDER_ITEMS = """
+    SELECT
+        ot.order_number,
+        ot.restaurant_id,
+        ot.status,
+        {timestamp} AS closed_at,
+        elem ->> 'food_name' AS food_name,
+        COALESCE((elem ->> 'quantity')::integer, 1) AS quantity,
+        COALESCE((elem ->> 'unit_price')::numeric, 0) * COALESCE((elem ->> 'quantity')::integer, 1) AS amount
+    FROM order_table ot
+    LEFT JOIN LATERAL jsonb_array_elements(ot.fooditems) AS elem ON true
+    WHERE {where}
+"""
+
+_APPLY_HOURLY = """
+    INSERT INTO sales_hourly_rollup (restaurant_id, bucket, status, order_count, revenue)
+    SELECT restaurant_id, date_trunc('hour', closed_at AT TIME ZONE %(time_zone)s) AT TIME ZONE %(time_zone)s, status,
+           {sign} * COUNT(DISTINCT order_number), {sign} * COALESCE(SUM(amount), 0)
+    FROM ({items}) items
+    GROUP BY 1, 2, 3
+    ON CONFLICT (restaurant_id, bucket, status) DO UPDATE
+    SET order_count = sales_hourly_rollup.order_count + EXCLUDED.order_count,
+        revenue = sales_hourly_rollup.revenue + EXCLUDED.revenue
+"""
+
+_APPLY_DISH = """
+    INSERT INTO sales_dish_rollup (restaurant_id, day, status, food_name, quantity, order_count, revenue)
+    SELECT restaurant_id, (closed_at AT TIME ZONE %(time_zone)s)::date, status, food_name,
+           {sign} * SUM(quantity), {sign} * COUNT(DISTINCT order_number), {sign} * SUM(amount)
+    FROM ({items}) items
+    WHERE food_name IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (restaurant_id, day, status, food_name) DO UPDATE
+    SET quantity = sales_dish_rollup.quantity + EXCLUDED.quantity,
+        order_count = sales_dish_rollup.order_count + EXCLUDED.order_count,
+        revenue = sales_dish_rollup.revenue + EXCLUDED.revenue
+"""
+
+
+def _apply(cursor, sign, timestamp, where, params):
+    items = _ORDER_ITEMS.format(timestamp=timestamp, where=where)
+    params = dict(params, time_zone=REPORT_TIME_ZONE)
+    cursor.execute(_APPLY_HOURLY.format(sign=sign, items=items), params)
+    cursor.execute(_APPLY_DISH.format(sign=sign, items=items), params)
+
+
+def apply_order(cursor, order_number, sign):
+    """
+    Add (sign=1) or remove (sign=-1) one closed order from the rollups.
+
+    Uses the order row as it currently is, so call it with sign=-1 *before*
+    changing the status of a closed order and with sign=1 *after* closing it,
+    inside the same transaction as the status update.
+    """
+    _apply(
+        cursor, int(sign), "ot.closed_at",
+        "ot.order_number = %(order_number)s AND ot.closed_at IS NOT NULL", {"order_number": order_number},
+    )
+
+
+def backfill(connection, timestamp_column="closed_at"):
+    """
+    Rebuild both rollup tables from all closed orders in one transaction.
+
+    Orders without ``closed_at`` get it copied from ``timestamp_column`` so
+    later status changes subtract from the bucket they were counted in.
+    Returns the number of closed orders that had no usable timestamp and were
+    left out.
+    """
+    cursor = connection.cursor()
+    try:
+        if timestamp_column != "closed_at":
+            cursor.execute(
+                sql.SQL(
+                    "UPDATE order_table SET closed_at = {} WHERE closed_at IS NULL AND status IN %s"
+                ).format(sql.Identifier(timestamp_column)),
+                (CLOSED_STATUSES,),
+            )
+            logger.info("Set closed_at from %s on %s orders", timestamp_column, cursor.rowcount)
+
+        cursor.execute("TRUNCATE sales_hourly_rollup, sales_dish_rollup")
+        _apply(
+            cursor, 1, "ot.closed_at",
+            "ot.status IN %(statuses)s AND ot.closed_at IS NOT NULL", {"statuses": CLOSED_STATUSES},
+        )
+
+        cursor.execute(
+            "SELECT COUNT(*) FROM order_table WHERE status IN %s AND closed_at IS NULL",
+            (CLOSED_STATUSES,),
+        )
+        skipped = cursor.fetchone()[0]
+        connection.commit()
+        return skipped
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    from utils.db_authenticate import get_connection
+
+    parser = argparse.ArgumentParser(description="Rebuild the sales rollups from existing closed orders.")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument(
+        "--timestamp-column",
+        default="closed_at",
+        help="order_table column used as the close time for orders closed before closed_at existed",
+    )
+    args = parser.parse_args()
+
+    connection = get_connection()
+    try:
+        skipped = backfill(connection, args.timestamp_column)
+        print("Rollups rebuilt.")
+        if skipped:
+            print(f"{skipped} closed orders have no timestamp and were not counted.")
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())